@@ -0,0 +1,287 @@
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from api.hobby_index import read_users
+from api.models import CustomUser, Hobby
+
+SCORES: Tuple[str, ...] = ('overlap', 'jaccard', 'cosine', 'idf')
+
+# Birthdate ordinals start at 1, so 0 marks users without one (never matched).
+_NO_BIRTHDATE: int = 0
+_POPCOUNT: np.ndarray = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """
+    Number of set bits in each row of a packed ``uint8`` matrix.
+    """
+    return _POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+
+def idf(user_counts: np.ndarray, total_users: int) -> np.ndarray:
+    """
+    Smoothed inverse document frequency, ``log((1 + N) / (1 + n)) + 1`` for
+    hobbies held by ``n`` of ``N`` users: rare hobbies weigh more, and every
+    shared hobby still counts.
+    """
+    return np.log((1 + total_users) / (1 + user_counts.astype(np.float64))) + 1
+
+
+class BitsetEngine:
+    """
+    Hobby-similarity engine over a packed users x hobbies bit matrix.
+
+    Each user is one row of ``uint8`` words with a bit per hobby, next to a
+    birthdate array, so scoring a user against every candidate is a single
+    vectorized AND + popcount with the age range applied as a mask. The top K
+    rows are selected with ``argpartition`` rather than a full sort.
+
+    Like ``api.hobby_index.HobbyIndex`` it lives in a single process and is
+    kept current from the model signals in ``api.signals``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._rows: Dict[int, int] = {}
+        self._columns: Dict[int, int] = {}
+        self._next_column: int = 0
+        self._size: int = 0
+        self._ids: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._birthdates: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._hobby_counts: np.ndarray = np.zeros(0, dtype=np.int32)
+        self._bits: np.ndarray = np.zeros((0, 0), dtype=np.uint8)
+        # IDF weight per column, read lazily by ``refresh_weights``.
+        self._weights: Optional[np.ndarray] = None
+        self._new_hobby_weight: float = 1.0
+        self._weights_at: float = 0.0
+
+    def load(self) -> None:
+        """
+        (Re)build the whole matrix from the database in two queries.
+        """
+        users = list(CustomUser.objects.order_by('id').values_list('id', 'date_of_birth').iterator())
+        through = CustomUser.hobbies.through
+        memberships = np.array(
+            list(through.objects.values_list('customuser_id', 'hobby_id').iterator()), dtype=np.int64
+        ).reshape(-1, 2)
+
+        ids = np.array([user_id for user_id, _ in users], dtype=np.int64)
+        birthdates = np.array(
+            [dob.toordinal() if dob else _NO_BIRTHDATE for _, dob in users], dtype=np.int64
+        )
+        hobby_ids = np.unique(memberships[:, 1])
+        bits = np.zeros((len(ids), (len(hobby_ids) + 7) // 8), dtype=np.uint8)
+        if len(ids) and len(memberships):
+            rows = np.searchsorted(ids, memberships[:, 0])
+            # Drop memberships of users created after the users query ran.
+            known = ids[np.minimum(rows, len(ids) - 1)] == memberships[:, 0]
+            rows = rows[known]
+            columns = np.searchsorted(hobby_ids, memberships[known, 1])
+            np.bitwise_or.at(bits, (rows, columns >> 3), (0x80 >> (columns & 7)).astype(np.uint8))
+
+        with self._lock:
+            self._rows = {user_id: row for row, user_id in enumerate(ids.tolist())}
+            self._columns = {hobby_id: column for column, hobby_id in enumerate(hobby_ids.tolist())}
+            self._next_column = len(hobby_ids)
+            self._size = len(ids)
+            self._ids = ids
+            self._birthdates = birthdates
+            self._hobby_counts = _popcount(bits)
+            self._bits = bits
+            self._weights = None
+
+    def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """
+        Re-read the hobbies and date of birth of ``user_ids`` from the database.
+        """
+        users = read_users(user_ids)
+        with self._lock:
+            for user_id, state in users.items():
+                birthdate, hobby_ids = state if state is not None else (None, set())
+                self._set_user(user_id, birthdate, hobby_ids)
+
+    def refresh_weights(self, max_age: Optional[float] = None) -> None:
+        """
+        Recompute the IDF weight of every hobby from ``Hobby.user_count`` in
+        one pass, unless the weights are younger than ``max_age`` seconds.
+        """
+        if max_age is not None and self._weights is not None and time.monotonic() - self._weights_at < max_age:
+            return
+        total_users: int = CustomUser.objects.count()
+        counts: Dict[int, int] = dict(Hobby.objects.values_list('id', 'user_count').iterator())
+        with self._lock:
+            hobby_ids = np.array(list(self._columns), dtype=np.int64)
+            columns = np.array(list(self._columns.values()), dtype=np.int64)
+            # Counters lag behind brand-new hobbies; treat them as held by one user.
+            user_counts = np.array([max(counts.get(hobby_id, 1), 1) for hobby_id in hobby_ids.tolist()])
+            self._new_hobby_weight = float(idf(np.array([1]), total_users)[0])
+            weights = np.full(self._bits.shape[1] * 8, self._new_hobby_weight)
+            weights[columns] = idf(user_counts, total_users)
+            self._weights = weights
+            self._weights_at = time.monotonic()
+
+    def remove_hobby(self, hobby_id: int) -> None:
+        with self._lock:
+            column: Optional[int] = self._columns.pop(hobby_id, None)
+            if column is None:
+                return
+            bits = self._bits[:self._size]
+            mask = np.uint8(0x80 >> (column & 7))
+            self._hobby_counts[:self._size] -= ((bits[:, column >> 3] & mask) > 0).astype(np.int32)
+            bits[:, column >> 3] &= ~mask
+
+    def _set_user(self, user_id: int, birthdate: Optional[int], hobby_ids: Set[int]) -> None:
+        row: Optional[int] = self._rows.get(user_id)
+        if row is None:
+            if not hobby_ids:
+                return
+            row = self._append_row(user_id)
+        for hobby_id in hobby_ids:
+            if hobby_id not in self._columns:
+                self._add_column(hobby_id)
+        self._bits[row] = 0
+        for hobby_id in hobby_ids:
+            column: int = self._columns[hobby_id]
+            self._bits[row, column >> 3] |= np.uint8(0x80 >> (column & 7))
+        self._birthdates[row] = birthdate or _NO_BIRTHDATE
+        self._hobby_counts[row] = len(hobby_ids)
+
+    def _append_row(self, user_id: int) -> int:
+        if self._size == len(self._ids):
+            # Grow geometrically so a stream of sign-ups stays amortized O(1).
+            capacity: int = max(16, 2 * len(self._ids))
+            self._ids = _grow(self._ids, capacity)
+            self._birthdates = _grow(self._birthdates, capacity)
+            self._hobby_counts = _grow(self._hobby_counts, capacity)
+            self._bits = _grow(self._bits, capacity)
+        row: int = self._size
+        self._size += 1
+        self._rows[user_id] = row
+        self._ids[row] = user_id
+        self._birthdates[row] = _NO_BIRTHDATE
+        self._hobby_counts[row] = 0
+        self._bits[row] = 0
+        return row
+
+    def _add_column(self, hobby_id: int) -> None:
+        column: int = self._next_column
+        self._next_column += 1
+        if column >> 3 >= self._bits.shape[1]:
+            width: int = max(1, 2 * self._bits.shape[1])
+            self._bits = np.pad(self._bits, ((0, 0), (0, width - self._bits.shape[1])))
+            if self._weights is not None:
+                self._weights = np.pad(self._weights, (0, width * 8 - len(self._weights)))
+        if self._weights is not None:
+            self._weights[column] = self._new_hobby_weight
+        self._columns[hobby_id] = column
+
+    def rank(
+        self,
+        user_id: int,
+        earliest_birthdate: date,
+        latest_birthdate: date,
+        score: str = 'overlap',
+        limit: int = 1000,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return ``(user_ids, common_hobbies, scores)`` for the ``limit`` best
+        matches of ``user_id`` born in ``[earliest_birthdate, latest_birthdate]``,
+        ordered by score descending, then id.
+
+        ``score`` is ``'overlap'`` (shared hobbies), ``'jaccard'`` (shared over
+        combined hobbies), ``'cosine'`` (shared over the geometric mean) or
+        ``'idf'`` (sum of the IDF weights of the shared hobbies, see
+        ``refresh_weights``).
+        """
+        if score not in SCORES:
+            raise ValueError(f'Unknown score "{score}"')
+        if score == 'idf' and self._weights is None:
+            self.refresh_weights()
+        with self._lock:
+            row: Optional[int] = self._rows.get(user_id)
+            if row is None:
+                empty = np.zeros(0, dtype=np.int64)
+                return empty, empty, np.zeros(0, dtype=np.float64)
+            size: int = self._size
+            bits = self._bits[:size]
+            common = _popcount(bits & bits[row])
+            birthdates = self._birthdates[:size]
+            mask = (common > 0) & (birthdates >= earliest_birthdate.toordinal()) & (
+                birthdates <= latest_birthdate.toordinal()
+            )
+            mask[row] = False
+            candidates = np.flatnonzero(mask)
+            ids = self._ids[candidates]
+            common = common[candidates]
+            counts = self._hobby_counts[candidates].astype(np.float64)
+            own: float = float(self._hobby_counts[row])
+            if score == 'idf':
+                # Only the requester's columns can be shared: test those bits
+                # for every candidate and dot them with the weights.
+                own_columns = np.flatnonzero(np.unpackbits(bits[row]))
+                shifts = (7 - (own_columns & 7)).astype(np.uint8)
+                shared = (bits[candidates][:, own_columns >> 3] >> shifts) & 1
+                weighted = shared @ self._weights[own_columns]
+
+        if score == 'jaccard':
+            scores = common / (counts + own - common)
+        elif score == 'cosine':
+            scores = common / np.sqrt(counts * own)
+        elif score == 'idf':
+            scores = weighted
+        else:
+            scores = common.astype(np.float64)
+
+        if limit < len(scores):
+            # Everything strictly above the k-th best score is in; the
+            # remaining slots go to the lowest ids among those tied with it.
+            kth: float = -np.partition(-scores, limit - 1)[limit - 1]
+            above = np.flatnonzero(scores > kth)
+            tied = np.flatnonzero(scores == kth)
+            tied = tied[np.argsort(ids[tied], kind='stable')][:limit - len(above)]
+            keep = np.concatenate((above, tied))
+            ids, common, scores = ids[keep], common[keep], scores[keep]
+
+        order = np.lexsort((ids, -scores))
+        return ids[order], common[order], scores[order]
+
+
+_engine: Optional[BitsetEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> BitsetEngine:
+    """
+    Return the process-wide engine, building it on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = BitsetEngine()
+                engine.load()
+                _engine = engine
+    return _engine
+
+
+def get_loaded_engine() -> Optional[BitsetEngine]:
+    """
+    Return the process-wide engine if it has been built, without building it.
+    """
+    return _engine
+
+
+def reset_engine() -> None:
+    global _engine
+    with _engine_lock:
+        _engine = None
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """
+    One subscriber's queue of events, bound to the event loop it was created
+    on. Events published from other threads are handed over with
+    ``call_soon_threadsafe``; a subscriber that falls ``maxsize`` events
+    behind drops new ones rather than growing without bound.
+    """
+
+    def __init__(self, channel: str, maxsize: int = 100) -> None:
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning('Dropping event for slow subscriber on %s', self.channel)
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event, or return ``None`` after ``timeout`` seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InMemoryBroker:
+    """
+    In-process pub/sub: events published on a channel are delivered to every
+    subscription to that channel in this process.
+
+    Enough for a single ASGI worker and for tests; with several workers use
+    a backend that fans out across processes, such as ``PostgresBroker``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, channel: str) -> Subscription:
+        """
+        Subscribe to ``channel``; must be called from a running event loop.
+        """
+        subscription = Subscription(channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions: Set[Subscription] = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        self._deliver(channel, event)
+
+    def _deliver(self, channel: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscriptions: List[Subscription] = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class PostgresBroker(InMemoryBroker):
+    """
+    Pub/sub across processes over PostgreSQL ``LISTEN``/``NOTIFY``.
+
+    Publishing sends a ``NOTIFY`` on the default database; each process runs
+    one listener thread on its own connection and fans the notifications out
+    to its local subscriptions.
+    """
+
+    PG_CHANNEL: str = 'hobbyconnect_events'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        payload: str = json.dumps({'channel': channel, 'event': event}, default=str)
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.PG_CHANNEL, payload])
+
+    def _listen(self) -> None:
+        import psycopg2
+
+        while True:
+            try:
+                conn = psycopg2.connect(**connections['default'].get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.PG_CHANNEL}')
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self._deliver(message['channel'], message['event'])
+            except Exception:
+                logger.exception('Event listener failed; reconnecting')
+                time.sleep(1)
+
+
+_broker: Optional[InMemoryBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> InMemoryBroker:
+    """
+    Return the process-wide broker of class ``settings.FRIEND_EVENTS_BACKEND``.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.FRIEND_EVENTS_BACKEND)()
+    return _broker
+
+
+def reset_broker() -> None:
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def friend_request_event(
+    kind: str, request_id: int, sender_id: int, sender: str, receiver_id: int, timestamp: Any
+) -> Dict[str, Any]:
+    return {
+        'type': kind,
+        'id': request_id,
+        'sender_id': sender_id,
+        'sender': sender,
+        'receiver_id': receiver_id,
+        'timestamp': timestamp.isoformat() if hasattr(timestamp, 'isoformat') else timestamp,
+    }
+
+
+def publish_on_commit(events: Iterable[Dict[str, Any]]) -> None:
+    """
+    Publish friend request ``events`` once the transaction commits.
+
+    New requests go to the receiver; accepted and rejected ones go to both
+    sides, so the sender learns the outcome and the receiver's other tabs
+    stay in sync.
+    """
+    events = list(events)
+    if not events:
+        return
+
+    def publish() -> None:
+        broker = get_broker()
+        for event in events:
+            recipients = [event['receiver_id']]
+            if event['type'] != 'created':
+                recipients.append(event['sender_id'])
+            for user_id in recipients:
+                broker.publish(user_channel(user_id), event)
+
+    transaction.on_commit(publish)
@@ -2,6 +2,7 @@ from typing import Any
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import CustomUser, Hobby
+from .utils import add_hobbies
 
 class CustomUserCreationForm(UserCreationForm):
     date_of_birth: forms.DateField = forms.DateField(
@@ -24,10 +25,7 @@ class CustomUserCreationForm(UserCreationForm):
 
         hobbies_text: str = self.cleaned_data.get('hobbies', '')
         if hobbies_text:
-            hobby_names = [h.strip() for h in hobbies_text.split(',') if h.strip()]
-            for name in hobby_names:
-                hobby, _ = Hobby.objects.get_or_create(name=name)
-                user.hobbies.add(hobby)
+            add_hobbies(user, hobbies_text.split(','))
 
         if commit:
             self.save_m2m()
@@ -65,7 +63,6 @@ class CustomUserChangeForm(UserChangeForm):
 
         new_hobby_name: str = self.cleaned_data.get('new_hobby', '')
         if new_hobby_name:
-            hobby, _ = Hobby.objects.get_or_create(name=new_hobby_name)
-            user.hobbies.add(hobby)
+            add_hobbies(user, [new_hobby_name])
 
         return user
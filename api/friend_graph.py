@@ -0,0 +1,226 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from api.models import Friendship
+
+# Edges added since the last compaction are kept in a small dict and folded
+# into the CSR arrays once there are this many of them.
+COMPACT_THRESHOLD: int = 10000
+
+
+def _gather_ranges(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """
+    Concatenate ``indices[indptr[n]:indptr[n + 1]]`` for every node in
+    ``nodes`` without a Python loop.
+    """
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total: int = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=indices.dtype)
+    # Offset of each gathered element from the start of its own range.
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return indices[np.repeat(starts, lengths) + within]
+
+
+class FriendGraph:
+    """
+    In-memory friendship graph in compressed-sparse-row form.
+
+    ``indptr``/``indices`` hold every friendship in both directions over dense
+    node numbers, so a user's friends are one slice and friends-of-friends are
+    one vectorized gather plus ``bincount``. New friendships are applied
+    incrementally from the signals in ``api.signals``; deletions mark the
+    graph stale and it is reloaded on next use.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._nodes: Dict[int, int] = {}
+        self._ids: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._new_ids: List[int] = []
+        self._indptr: np.ndarray = np.zeros(1, dtype=np.int64)
+        self._indices: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._added: Dict[int, Set[int]] = {}
+        self._pending: int = 0
+        self.stale: bool = False
+
+    def load(self) -> None:
+        """
+        (Re)build the graph from the Friendship table in one query.
+        """
+        edges = np.array(list(Friendship.objects.values_list('user1_id', 'user2_id').iterator()), dtype=np.int64)
+        edges = edges.reshape(-1, 2)
+        ids, nodes = np.unique(edges, return_inverse=True)
+        nodes = nodes.reshape(-1, 2)
+        with self._lock:
+            self._nodes = {user_id: node for node, user_id in enumerate(ids.tolist())}
+            self._ids = ids
+            self._new_ids = []
+            self._added = {}
+            self._pending = 0
+            self._build(np.concatenate((nodes[:, 0], nodes[:, 1])), np.concatenate((nodes[:, 1], nodes[:, 0])))
+            self.stale = False
+
+    def _build(self, sources: np.ndarray, targets: np.ndarray) -> None:
+        order = np.lexsort((targets, sources))
+        self._indices = targets[order]
+        self._indptr = np.zeros(len(self._ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(self._ids)), out=self._indptr[1:])
+
+    def _node(self, user_id: int) -> int:
+        node: Optional[int] = self._nodes.get(user_id)
+        if node is None:
+            node = self._nodes[user_id] = len(self._ids) + len(self._new_ids)
+            self._new_ids.append(user_id)
+        return node
+
+    def add_edges(self, pairs: Iterable[Tuple[int, int]]) -> None:
+        """
+        Add friendships between ``(user_id, user_id)`` pairs. Pairs that are
+        already friends are ignored.
+        """
+        with self._lock:
+            for user_a, user_b in pairs:
+                node_a, node_b = self._node(user_a), self._node(user_b)
+                if self._has_edge(node_a, node_b):
+                    continue
+                self._added.setdefault(node_a, set()).add(node_b)
+                self._added.setdefault(node_b, set()).add(node_a)
+                self._pending += 1
+            if self._pending >= COMPACT_THRESHOLD:
+                self._compact()
+
+    def _has_edge(self, node_a: int, node_b: int) -> bool:
+        if node_b in self._added.get(node_a, ()):
+            return True
+        if node_a >= len(self._indptr) - 1:
+            return False
+        csr = self._indices[self._indptr[node_a]:self._indptr[node_a + 1]]
+        position: int = int(np.searchsorted(csr, node_b))
+        return position < len(csr) and csr[position] == node_b
+
+    def _compact(self) -> None:
+        built: int = len(self._indptr) - 1
+        sources = np.repeat(np.arange(built), np.diff(self._indptr))
+        added_sources = np.array([a for a, targets in self._added.items() for _ in targets], dtype=np.int64)
+        added_targets = np.array([b for targets in self._added.values() for b in targets], dtype=np.int64)
+        self._ids = np.concatenate((self._ids, np.array(self._new_ids, dtype=np.int64)))
+        self._new_ids = []
+        self._added = {}
+        self._pending = 0
+        self._build(np.concatenate((sources, added_sources)), np.concatenate((self._indices, added_targets)))
+
+    def _neighbours(self, node: int) -> np.ndarray:
+        built: int = len(self._indptr) - 1
+        csr = self._indices[self._indptr[node]:self._indptr[node + 1]] if node < built else np.zeros(0, np.int64)
+        added = self._added.get(node)
+        if not added:
+            return csr
+        return np.union1d(csr, np.fromiter(added, dtype=np.int64))
+
+    def _user_ids(self, nodes: np.ndarray) -> np.ndarray:
+        if not self._new_ids:
+            return self._ids[nodes]
+        return np.concatenate((self._ids, np.array(self._new_ids, dtype=np.int64)))[nodes]
+
+    def friend_ids(self, user_id: int) -> np.ndarray:
+        with self._lock:
+            node: Optional[int] = self._nodes.get(user_id)
+            if node is None:
+                return np.zeros(0, dtype=np.int64)
+            return self._user_ids(self._neighbours(node))
+
+    def _two_hop_counts(self, node: int, friends: np.ndarray) -> np.ndarray:
+        """
+        Number of paths of length two from ``node`` to every node, given its
+        ``friends``.
+        """
+        built: int = len(self._indptr) - 1
+        counts = np.bincount(
+            _gather_ranges(self._indptr, self._indices, friends[friends < built]),
+            minlength=len(self._ids) + len(self._new_ids),
+        )
+        for friend in friends.tolist():
+            for node_b in self._added.get(friend, ()):
+                counts[node_b] += 1
+        return counts
+
+    def mutual_friends_with(self, user_id: int, other_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Return the number of friends ``user_id`` shares with each of ``other_ids``.
+        """
+        with self._lock:
+            node: Optional[int] = self._nodes.get(user_id)
+            if node is None:
+                return {other_id: 0 for other_id in other_ids}
+            counts = self._two_hop_counts(node, self._neighbours(node))
+            return {
+                other_id: int(counts[self._nodes[other_id]]) if other_id in self._nodes else 0
+                for other_id in other_ids
+            }
+
+    def mutual_friend_counts(self, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return ``(user_ids, counts)`` of every non-friend sharing at least one
+        friend with ``user_id``.
+        """
+        with self._lock:
+            node: Optional[int] = self._nodes.get(user_id)
+            empty = np.zeros(0, dtype=np.int64)
+            if node is None:
+                return empty, empty
+            friends = self._neighbours(node)
+            counts = self._two_hop_counts(node, friends)
+            counts[friends] = 0
+            counts[node] = 0
+            candidates = np.flatnonzero(counts)
+            return self._user_ids(candidates), counts[candidates]
+
+    def suggest(self, user_id: int, limit: int) -> List[Tuple[int, int]]:
+        """
+        Return up to ``limit`` ``(user_id, mutual_friends)`` pairs, most
+        mutual friends first, then by id.
+        """
+        ids, counts = self.mutual_friend_counts(user_id)
+        if limit < len(ids):
+            top = np.argpartition(-counts, limit - 1)[:limit]
+            kth: int = counts[top].min()
+            # Keep ties at the cut-off deterministic: lowest ids win.
+            above = np.flatnonzero(counts > kth)
+            tied = np.flatnonzero(counts == kth)
+            tied = tied[np.argsort(ids[tied], kind='stable')][:limit - len(above)]
+            keep = np.concatenate((above, tied))
+            ids, counts = ids[keep], counts[keep]
+        order = np.lexsort((ids, -counts))
+        return list(zip(ids[order].tolist(), counts[order].tolist()))
+
+
+_graph: Optional[FriendGraph] = None
+_graph_lock = threading.Lock()
+
+
+def get_graph() -> FriendGraph:
+    """
+    Return the process-wide graph, (re)building it when missing or stale.
+    """
+    global _graph
+    if _graph is None or _graph.stale:
+        with _graph_lock:
+            if _graph is None or _graph.stale:
+                graph = FriendGraph()
+                graph.load()
+                _graph = graph
+    return _graph
+
+
+def get_loaded_graph() -> Optional[FriendGraph]:
+    return _graph
+
+
+def reset_graph() -> None:
+    global _graph
+    with _graph_lock:
+        _graph = None
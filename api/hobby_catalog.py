@@ -0,0 +1,83 @@
+import gzip
+import json
+import time
+from typing import Dict, List, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+from api.models import Hobby
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered.
+    brotli = None
+
+VERSION_KEY: str = 'hobbies:catalog:version'
+
+
+def _cache() -> BaseCache:
+    return caches['default']
+
+
+def get_version() -> int:
+    """
+    Return the current catalog version, which names the cached payload and
+    its ETag.
+    """
+    cache = _cache()
+    version: Optional[int] = cache.get(VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so a lost counter never reuses an old ETag.
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version() -> None:
+    """
+    Invalidate the cached catalog (and every client's ETag).
+    """
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def etag(version: int) -> str:
+    # Weak, because the same catalog is served in several encodings.
+    return f'W/"hobbies-{version}"'
+
+
+def get_payloads(version: int) -> Dict[str, bytes]:
+    """
+    Return the catalog JSON for ``version`` keyed by content coding
+    ("identity", "gzip" and, if brotli is installed, "br"), serializing and
+    compressing it once per version.
+    """
+    cache = _cache()
+    key: str = f'hobbies:catalog:{version}'
+    payloads: Optional[Dict[str, bytes]] = cache.get(key)
+    if payloads is None:
+        hobbies: List[Dict] = list(Hobby.objects.order_by('id').values('id', 'name', 'description'))
+        body: bytes = json.dumps({'hobbies': hobbies}).encode()
+        payloads = {'identity': body, 'gzip': gzip.compress(body, mtime=0)}
+        if brotli is not None:
+            payloads['br'] = brotli.compress(body)
+        cache.set(key, payloads, timeout=None)
+    return payloads
+
+
+def negotiate(accept_encoding: str, available: Dict[str, bytes]) -> str:
+    """
+    Pick "br", "gzip" or "identity" from an ``Accept-Encoding`` header.
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    for coding in ('br', 'gzip'):
+        if coding in available and coding in accepted:
+            return coding
+    return 'identity'
@@ -0,0 +1,187 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from datetime import date
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from api.models import CustomUser
+
+
+def read_users(user_ids: Iterable[int]) -> Dict[int, Optional[Tuple[Optional[int], Set[int]]]]:
+    """
+    Read ``(birthdate ordinal, hobby ids)`` for each of ``user_ids`` in two
+    queries. Users that no longer exist map to ``None``.
+    """
+    users: Dict[int, Optional[Tuple[Optional[int], Set[int]]]] = {user_id: None for user_id in user_ids}
+    if not users:
+        return users
+    for user_id, dob in CustomUser.objects.filter(id__in=users).values_list('id', 'date_of_birth'):
+        users[user_id] = (dob.toordinal() if dob else None, set())
+    through = CustomUser.hobbies.through
+    for user_id, hobby_id in through.objects.filter(customuser_id__in=users).values_list('customuser_id', 'hobby_id'):
+        state = users[user_id]
+        if state is not None:
+            state[1].add(hobby_id)
+    return users
+
+
+class HobbyIndex:
+    """
+    In-process inverted index of hobby memberships.
+
+    Keeps ``hobby_id -> sorted array of user ids`` posting lists plus each
+    user's date of birth, so similar users can be ranked by merging the
+    requester's posting lists instead of running the hobbies join and
+    ``Count(distinct=True)`` aggregate in the database.
+
+    The index lives in a single process: each worker builds its own copy and
+    keeps it current from the model signals in ``api.signals``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._postings: Dict[int, array] = {}
+        self._user_hobbies: Dict[int, Set[int]] = {}
+        self._birthdates: Dict[int, Optional[int]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickled to hand a snapshot to worker processes (see build_matches).
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        """
+        (Re)build the whole index from the database in two queries.
+        """
+        through = CustomUser.hobbies.through
+        postings: Dict[int, array] = {}
+        user_hobbies: Dict[int, Set[int]] = {}
+        rows = through.objects.order_by('hobby_id', 'customuser_id').values_list('hobby_id', 'customuser_id')
+        for hobby_id, user_id in rows.iterator():
+            postings.setdefault(hobby_id, array('q')).append(user_id)
+            user_hobbies.setdefault(user_id, set()).add(hobby_id)
+        birthdates: Dict[int, Optional[int]] = {
+            user_id: dob.toordinal() if dob else None
+            for user_id, dob in CustomUser.objects.values_list('id', 'date_of_birth').iterator()
+        }
+        with self._lock:
+            self._postings = postings
+            self._user_hobbies = user_hobbies
+            self._birthdates = birthdates
+
+    def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """
+        Re-read the hobbies and date of birth of ``user_ids`` from the database.
+
+        Users that no longer exist are dropped from the index.
+        """
+        users: Dict[int, Optional[Tuple[Optional[int], Set[int]]]] = read_users(user_ids)
+        with self._lock:
+            for user_id, state in users.items():
+                if state is None:
+                    self._remove_user(user_id)
+                else:
+                    self._set_user(user_id, *state)
+
+    def remove_hobby(self, hobby_id: int) -> None:
+        with self._lock:
+            for user_id in self._postings.pop(hobby_id, ()):
+                self._user_hobbies.get(user_id, set()).discard(hobby_id)
+
+    def _set_user(self, user_id: int, birthdate: Optional[int], hobby_ids: Set[int]) -> None:
+        current: Set[int] = self._user_hobbies.get(user_id, set())
+        for hobby_id in current - hobby_ids:
+            posting = self._postings[hobby_id]
+            del posting[bisect_left(posting, user_id)]
+            if not posting:
+                del self._postings[hobby_id]
+        for hobby_id in hobby_ids - current:
+            insort(self._postings.setdefault(hobby_id, array('q')), user_id)
+        self._user_hobbies[user_id] = set(hobby_ids)
+        self._birthdates[user_id] = birthdate
+
+    def _remove_user(self, user_id: int) -> None:
+        self._set_user(user_id, None, set())
+        self._user_hobbies.pop(user_id)
+        self._birthdates.pop(user_id)
+
+    def user_ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._birthdates)
+
+    def birthdate(self, user_id: int) -> Optional[int]:
+        return self._birthdates.get(user_id)
+
+    def users_sharing_hobbies(self, user_ids: Iterable[int]) -> Set[int]:
+        """
+        Return the users sharing at least one hobby with any of ``user_ids``.
+        """
+        shared: Set[int] = set()
+        with self._lock:
+            for user_id in user_ids:
+                for hobby_id in self._user_hobbies.get(user_id, ()):
+                    shared.update(self._postings.get(hobby_id, ()))
+        return shared
+
+    def rank(self, user_id: int, earliest_birthdate: date, latest_birthdate: date) -> List[Tuple[int, int]]:
+        """
+        Return ``(user_id, common_hobbies)`` pairs for every other user born in
+        ``[earliest_birthdate, latest_birthdate]`` who shares at least one
+        hobby with ``user_id``, ordered by common hobbies descending, then id.
+        """
+        earliest: int = earliest_birthdate.toordinal()
+        latest: int = latest_birthdate.toordinal()
+        with self._lock:
+            postings = [self._postings[h] for h in self._user_hobbies.get(user_id, ()) if h in self._postings]
+            birthdates = self._birthdates
+            ranking: List[Tuple[int, int]] = []
+            # The merged stream is sorted by user id, so equal ids are adjacent
+            # and the group length is the number of hobbies in common.
+            for candidate_id, group in groupby(heapq.merge(*postings)):
+                if candidate_id == user_id:
+                    continue
+                dob: Optional[int] = birthdates.get(candidate_id)
+                if dob is None or not earliest <= dob <= latest:
+                    continue
+                ranking.append((candidate_id, sum(1 for _ in group)))
+        # Stable sort keeps ascending ids within each common-hobby count.
+        ranking.sort(key=lambda row: -row[1])
+        return ranking
+
+
+_index: Optional[HobbyIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> HobbyIndex:
+    """
+    Return the process-wide index, building it on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = HobbyIndex()
+                index.load()
+                _index = index
+    return _index
+
+
+def get_loaded_index() -> Optional[HobbyIndex]:
+    """
+    Return the process-wide index if it has been built, without building it.
+    """
+    return _index
+
+
+def reset_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
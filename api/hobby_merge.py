@@ -0,0 +1,95 @@
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from api.models import Hobby
+from api.signals import hobbies_created
+
+# The functions below take the models as arguments; ``merge_hobbies`` passes
+# the live ones. Migration 0014 keeps its own copy of this logic.
+
+
+def find_duplicates(hobby_model: Type[models.Model]) -> List[Tuple[int, List[int]]]:
+    """
+    Return ``(keeper_id, duplicate_ids)`` for every group of hobbies whose
+    names share a ``Hobby.name_key``; the oldest hobby of a group is kept.
+    """
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for hobby_id, name in hobby_model.objects.order_by('id').values_list('id', 'name').iterator():
+        groups[Hobby.name_key(name)].append(hobby_id)
+    return [(ids[0], ids[1:]) for ids in groups.values() if len(ids) > 1]
+
+
+def move_memberships(
+    through_model: Type[models.Model], duplicate_id: int, keeper_id: int, batch_size: int
+) -> Set[int]:
+    """
+    Move the through-table rows of ``duplicate_id`` to ``keeper_id``, at most
+    ``batch_size`` rows per transaction so no lock is held for long. Returns
+    the ids of the users whose rows moved.
+    """
+    user_ids: Set[int] = set()
+    while True:
+        with transaction.atomic():
+            rows: List[Tuple[int, int]] = list(
+                through_model.objects.filter(hobby_id=duplicate_id)
+                                     .order_by('id')
+                                     .values_list('id', 'customuser_id')[:batch_size]
+            )
+            if not rows:
+                return user_ids
+            batch_users: List[int] = [user_id for _, user_id in rows]
+            # Users with both hobbies already have the keeper row.
+            through_model.objects.bulk_create(
+                [through_model(customuser_id=user_id, hobby_id=keeper_id) for user_id in batch_users],
+                ignore_conflicts=True,
+            )
+            through_model.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+            user_ids.update(batch_users)
+
+
+def merge_duplicates(
+    hobby_model: Type[models.Model],
+    through_model: Type[models.Model],
+    batch_size: int = 1000,
+    on_merged: Optional[Callable[[int, List[int], Set[int]], None]] = None,
+) -> int:
+    """
+    Merge every group of duplicate hobbies into its oldest member, calling
+    ``on_merged(keeper_id, duplicate_ids, user_ids)`` after each group.
+    Returns the number of hobbies removed.
+    """
+    removed: int = 0
+    for keeper_id, duplicate_ids in find_duplicates(hobby_model):
+        user_ids: Set[int] = set()
+        for duplicate_id in duplicate_ids:
+            user_ids |= move_memberships(through_model, duplicate_id, keeper_id, batch_size)
+            # Deleted through the model so delete signals see each hobby.
+            for hobby in hobby_model.objects.filter(id=duplicate_id):
+                hobby.delete()
+        removed += len(duplicate_ids)
+        if on_merged is not None:
+            on_merged(keeper_id, duplicate_ids, user_ids)
+    return removed
+
+
+def normalize_names(hobby_model: Type[models.Model]) -> List[int]:
+    """
+    Store every hobby name in its normalized form. Run after
+    ``merge_duplicates``, which leaves at most one hobby per key. Returns the
+    ids of the renamed hobbies.
+
+    ``update()`` skips ``auto_now`` and ``post_save``, so ``updated_at`` is
+    set here (for ``/api/sync/`` deltas) and the renamed hobbies are handed to
+    ``hobbies_created`` (catalog ETag and search index).
+    """
+    renamed: List[int] = []
+    for hobby_id, name in list(hobby_model.objects.values_list('id', 'name')):
+        normalized: str = Hobby.normalize_name(name)
+        if normalized != name:
+            hobby_model.objects.filter(id=hobby_id).update(name=normalized, updated_at=timezone.now())
+            renamed.append(hobby_id)
+    hobbies_created(list(hobby_model.objects.filter(id__in=renamed).only('id', 'name')))
+    return renamed
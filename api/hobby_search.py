@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from django.db.models.functions import Lower
+
+from api.models import Hobby
+
+
+def fold(name: str) -> str:
+    """
+    Search key of a hobby name or query: whitespace collapsed and case-folded.
+    """
+    return ' '.join(name.split()).casefold()
+
+
+class HobbySearchIndex:
+    """
+    In-memory prefix index over hobby names.
+
+    Keeps the folded names in one sorted list (with ids and display names in
+    parallel lists), so a prefix lookup is a ``bisect`` plus a short scan:
+    O(log n + limit) however large the catalog. Hobby saves and deletes are
+    applied incrementally from the signals in ``api.signals``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._keys: List[str] = []
+        self._ids: List[int] = []
+        self._names: List[str] = []
+        self._key_of: Dict[int, str] = {}
+
+    def load(self) -> None:
+        """
+        (Re)build the index from the database in one query.
+        """
+        rows: List[Tuple[str, int, str]] = sorted(
+            (fold(name), hobby_id, name) for hobby_id, name in Hobby.objects.values_list('id', 'name').iterator()
+        )
+        with self._lock:
+            self._keys = [key for key, _, _ in rows]
+            self._ids = [hobby_id for _, hobby_id, _ in rows]
+            self._names = [name for _, _, name in rows]
+            self._key_of = {hobby_id: key for key, hobby_id, _ in rows}
+
+    def _position(self, key: str, hobby_id: int) -> int:
+        # Equal keys are ordered by id, so search for the exact (key, id) slot.
+        position: int = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key and self._ids[position] < hobby_id:
+            position += 1
+        return position
+
+    def set(self, hobby_id: int, name: str) -> None:
+        with self._lock:
+            self.remove(hobby_id)
+            key: str = fold(name)
+            position: int = self._position(key, hobby_id)
+            self._keys.insert(position, key)
+            self._ids.insert(position, hobby_id)
+            self._names.insert(position, name)
+            self._key_of[hobby_id] = key
+
+    def remove(self, hobby_id: int) -> None:
+        with self._lock:
+            key: Optional[str] = self._key_of.pop(hobby_id, None)
+            if key is None:
+                return
+            position: int = self._position(key, hobby_id)
+            del self._keys[position], self._ids[position], self._names[position]
+
+    def search(self, prefix: str, limit: int) -> List[Dict[str, object]]:
+        """
+        Return up to ``limit`` ``{"id", "name"}`` hobbies whose folded name
+        starts with the folded ``prefix``, in folded-name order.
+        """
+        prefix = fold(prefix)
+        with self._lock:
+            position: int = bisect_left(self._keys, prefix)
+            end: int = min(position + limit, len(self._keys))
+            results: List[Dict[str, object]] = []
+            while position < end and self._keys[position].startswith(prefix):
+                results.append({'id': self._ids[position], 'name': self._names[position]})
+                position += 1
+            return results
+
+
+def search_database(prefix: str, limit: int) -> List[Dict[str, object]]:
+    """
+    Prefix search in the database. The range on ``LOWER(name)`` can use the
+    api_hobby_name_ci_unique index; ``startswith`` keeps the result exact.
+
+    Note that SQLite's ``LOWER`` only folds ASCII letters, unlike the
+    in-memory index.
+    """
+    hobbies = Hobby.objects.annotate(name_lower=Lower('name'))
+    prefix = ' '.join(prefix.split()).lower()
+    if prefix:
+        hobbies = hobbies.filter(name_lower__gte=prefix, name_lower__startswith=prefix)
+        if ord(prefix[-1]) < 0x10FFFF:
+            hobbies = hobbies.filter(name_lower__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return list(hobbies.order_by('name_lower', 'id').values('id', 'name')[:limit])
+
+
+_index: Optional[HobbySearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> HobbySearchIndex:
+    """
+    Return the process-wide index, building it on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = HobbySearchIndex()
+                index.load()
+                _index = index
+    return _index
+
+
+def get_loaded_search_index() -> Optional[HobbySearchIndex]:
+    """
+    Return the process-wide index if it has been built, without building it.
+    """
+    return _index
+
+
+def reset_search_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,80 @@
+import random
+import time
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from api.hobby_index import HobbyIndex
+from api.minhash_index import MinHashIndex, build_hasher
+from api.utils import rank_candidates
+
+
+def _ms(seconds: List[float]) -> str:
+    return f'{np.percentile(seconds, 50) * 1000:8.2f} {np.percentile(seconds, 99) * 1000:8.2f}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the recall and latency of ?source=minhash against the exact "
+        "hobby index, for one or more MINHASH_MAX_CANDIDATES values. Recall@k "
+        "is the share of the exact top k matched by the approximate top k, "
+        "counting any user tied with the exact k-th score as a match."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--sample', type=int, default=100, help='Users to query.')
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument(
+            '--max-candidates', type=int, nargs='+', default=[settings.MINHASH_MAX_CANDIDATES],
+            help='Candidate caps to compare.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        top_k: int = options['top_k']
+        exact_index = HobbyIndex()
+        exact_index.load()
+        started: float = time.perf_counter()
+        minhash = MinHashIndex(build_hasher())
+        minhash.load()
+        self.stdout.write(f'MinHash index loaded in {time.perf_counter() - started:.2f} s.')
+
+        user_ids: List[int] = exact_index.user_ids()
+        random.Random(options['seed']).shuffle(user_ids)
+        users: List[int] = []
+        exact: Dict[int, List[Tuple[int, int]]] = {}
+        exact_times: List[float] = []
+        for user_id in user_ids:
+            if len(users) == options['sample']:
+                break
+            started = time.perf_counter()
+            ranking: List[Tuple[int, int]] = exact_index.rank(user_id, date.min, date.max)[:top_k]
+            exact_times.append(time.perf_counter() - started)
+            if ranking:
+                users.append(user_id)
+                exact[user_id] = ranking
+
+        self.stdout.write(f'{len(users)} users, recall@{top_k}; latency p50/p99 in ms.')
+        self.stdout.write(f'{"exact index":>16} {"":>8} {"":>10} {"":>17} {_ms(exact_times)}')
+        self.stdout.write(f'{"max candidates":>16} {"recall":>8} {"found":>10} {"buckets":>17} {"total":>17}')
+        for max_candidates in options['max_candidates']:
+            recalls: List[float] = []
+            found: List[int] = []
+            bucket_times: List[float] = []
+            total_times: List[float] = []
+            for user_id in users:
+                started = time.perf_counter()
+                candidates: List[int] = minhash.candidates(user_id, max_candidates)
+                bucket_times.append(time.perf_counter() - started)
+                ranking = rank_candidates(user_id, candidates, date.min, date.max)[:top_k]
+                total_times.append(time.perf_counter() - started)
+                kth: int = exact[user_id][-1][1]
+                recalls.append(sum(1 for _, common in ranking if common >= kth) / len(exact[user_id]))
+                found.append(len(candidates))
+            self.stdout.write(
+                f'{max_candidates:>16} {np.mean(recalls):8.3f} {np.mean(found):10.1f} '
+                f'{_ms(bucket_times)} {_ms(total_times)}'
+            )
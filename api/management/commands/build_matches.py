@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connections, transaction
+from django.utils import timezone
+
+from api.hobby_index import HobbyIndex
+from api.match_worker import compute_matches, init_worker
+from api.models import CustomUser, MatchBuild, SimilarUserMatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute each user's top-K similar users into SimilarUserMatch, "
+        "served by fetch-similar-users with ?source=precomputed."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only rebuild users affected by hobby or birthdate changes since the last build.',
+        )
+        parser.add_argument('--top-k', type=int, default=settings.MATCHES_TOP_K)
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes; 1 runs in-process.')
+        parser.add_argument('--shard-size', type=int, default=1000, help='Users per worker task.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        build = MatchBuild(started_at=timezone.now(), incremental=options['incremental'])
+        index = HobbyIndex()
+        index.load()
+
+        if options['incremental']:
+            last: Optional[MatchBuild] = (
+                MatchBuild.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+            )
+            if last is None:
+                raise CommandError('No previous build found; run build_matches without --incremental first.')
+            user_ids: List[int] = sorted(self.affected_users(index, last.started_at))
+        else:
+            user_ids = index.user_ids()
+
+        shards: List[List[int]] = [
+            user_ids[i:i + options['shard_size']] for i in range(0, len(user_ids), options['shard_size'])
+        ]
+        top_k: int = options['top_k']
+        if options['workers'] > 1 and len(shards) > 1:
+            # Workers only read the index snapshot; they never use these connections.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=init_worker, initargs=(index.__getstate__(),)
+            ) as pool:
+                for shard, rows in zip(shards, pool.map(compute_matches, shards, [top_k] * len(shards))):
+                    self.write_shard(shard, rows, options['batch_size'])
+        else:
+            for shard in shards:
+                self.write_shard(shard, compute_matches(shard, top_k, index), options['batch_size'])
+
+        build.finished_at = timezone.now()
+        build.users_built = len(user_ids)
+        build.save()
+        self.stdout.write(self.style.SUCCESS(f'Built matches for {len(user_ids)} users.'))
+
+    def affected_users(self, index: HobbyIndex, since: Any) -> Set[int]:
+        """
+        Users whose top-K may have changed since ``since``: the changed users,
+        everyone who currently shares a hobby with them, and everyone holding
+        one of them as a precomputed candidate (covers removed hobbies).
+        """
+        changed: Set[int] = set(
+            CustomUser.objects.filter(hobbies_updated_at__gte=since).values_list('id', flat=True)
+        )
+        affected: Set[int] = changed | index.users_sharing_hobbies(changed)
+        affected.update(
+            SimilarUserMatch.objects.filter(candidate__hobbies_updated_at__gte=since)
+                                    .values_list('user_id', flat=True)
+        )
+        return affected
+
+    def write_shard(self, user_ids: Iterable[int], rows: List[Tuple[int, int, int, int]], batch_size: int) -> None:
+        with transaction.atomic():
+            SimilarUserMatch.objects.filter(user_id__in=user_ids).delete()
+            SimilarUserMatch.objects.bulk_create(
+                (
+                    SimilarUserMatch(
+                        user_id=user_id,
+                        candidate_id=candidate_id,
+                        common_hobbies=common_hobbies,
+                        candidate_dob=date.fromordinal(dob),
+                    )
+                    for user_id, candidate_id, common_hobbies, dob in rows
+                ),
+                batch_size=batch_size,
+            )
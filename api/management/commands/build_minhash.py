@@ -0,0 +1,50 @@
+from typing import Any, List
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.utils import timezone
+
+from api.minhash_index import build_hasher, read_memberships, stale_signatures
+from api.models import CustomUser, MinHashSignature
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute and store each user's MinHash signature, which the LSH index "
+        "behind fetch-similar-users ?source=minhash loads on start. Run a full "
+        "build after changing MINHASH_PERMUTATIONS."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only rebuild users whose signature is missing or older than their hobbies.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users per transaction.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        users = CustomUser.objects.order_by('id')
+        if options['incremental']:
+            users = users.filter(stale_signatures())
+        user_ids: List[int] = list(users.values_list('id', flat=True))
+        hasher = build_hasher()
+        built: int = 0
+        for first in range(0, len(user_ids), options['batch_size']):
+            batch: List[int] = user_ids[first:first + options['batch_size']]
+            # Taken before reading hobbies, so changes made meanwhile leave the
+            # signature stale rather than silently missing.
+            computed_at = timezone.now()
+            ids, signatures = hasher.signatures(read_memberships(batch))
+            with transaction.atomic():
+                # Users without hobbies are not indexed.
+                MinHashSignature.objects.filter(user_id__in=batch).exclude(user_id__in=ids.tolist()).delete()
+                MinHashSignature.objects.bulk_create(
+                    [
+                        MinHashSignature(user_id=user_id, signature=signature.astype('<u4').tobytes(),
+                                         computed_at=computed_at)
+                        for user_id, signature in zip(ids.tolist(), signatures)
+                    ],
+                    update_conflicts=True, unique_fields=['user'], update_fields=['signature', 'computed_at'],
+                )
+            built += len(ids)
+        self.stdout.write(self.style.SUCCESS(f'Built MinHash signatures for {built} users.'))
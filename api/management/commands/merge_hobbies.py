@@ -0,0 +1,43 @@
+from typing import Any, List, Set
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from api import hobby_merge
+from api.models import CustomUser, Hobby
+from api.signals import hobby_memberships_moved
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge hobbies whose names only differ in case or whitespace into the "
+        "oldest of them, moving user memberships in small batches. In-process "
+        "matching engines of running servers pick the change up on restart. "
+        "Needs all api migrations applied."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000, help='Membership rows moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='List the duplicates without merging them.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['dry_run']:
+            duplicates = hobby_merge.find_duplicates(Hobby)
+            names = dict(Hobby.objects.filter(
+                id__in=[hobby_id for keeper_id, ids in duplicates for hobby_id in [keeper_id, *ids]]
+            ).values_list('id', 'name'))
+            for keeper_id, duplicate_ids in duplicates:
+                merged: str = ', '.join(repr(names[hobby_id]) for hobby_id in duplicate_ids)
+                self.stdout.write(f'{names[keeper_id]!r} <- {merged}')
+            self.stdout.write(f'{sum(len(ids) for _, ids in duplicates)} hobbies would be merged.')
+            return
+
+        def merged(keeper_id: int, duplicate_ids: List[int], user_ids: Set[int]) -> None:
+            hobby_memberships_moved(user_ids)
+            Hobby.reconcile_user_counts([keeper_id])
+            self.stdout.write(f'Merged {len(duplicate_ids)} hobbies into {keeper_id} ({len(user_ids)} users).')
+
+        removed: int = hobby_merge.merge_duplicates(
+            Hobby, CustomUser.hobbies.through, options['batch_size'], on_merged=merged
+        )
+        renamed: List[int] = hobby_merge.normalize_names(Hobby)
+        self.stdout.write(f'Removed {removed} duplicate hobbies and normalized {len(renamed)} names.')
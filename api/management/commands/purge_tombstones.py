@@ -0,0 +1,22 @@
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from api.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete deletion tombstones older than SYNC_TOMBSTONE_DAYS. Clients "
+        "with older sync tokens get a full resync instead."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--days', type=int, default=settings.SYNC_TOMBSTONE_DAYS)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=options['days'])).delete()
+        self.stdout.write(f'Deleted {deleted} tombstones.')
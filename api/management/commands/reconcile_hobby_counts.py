@@ -0,0 +1,16 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from api.models import Hobby
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount Hobby.user_count from the user-hobby table, correcting drift "
+        "from bulk writes that bypass signals. Meant to run nightly."
+    )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        corrected: int = Hobby.reconcile_user_counts()
+        self.stdout.write(f'Corrected {corrected} hobby counts.')
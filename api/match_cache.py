@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+VERSION_KEY: str = 'matches:version'
+
+
+def _cache() -> BaseCache:
+    return caches[settings.MATCH_CACHE_ALIAS]
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function and every caller that arrives while it runs waits for, and
+    shares, its result (or exception).
+    """
+
+    class _Call:
+        def __init__(self) -> None:
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call: Optional[SingleFlight._Call] = self._calls.get(key)
+            leader: bool = call is None
+            if call is None:
+                call = self._calls[key] = SingleFlight._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_flight = SingleFlight()
+
+
+def get_version() -> int:
+    """
+    Return the current match version, which is part of every cache key.
+    """
+    cache = _cache()
+    version: Optional[int] = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted version never goes back to a
+        # value that older entries may still be stored under.
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version() -> None:
+    """
+    Invalidate every cached match list.
+    """
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def get_or_compute(key: str, compute: Callable[[], Any]) -> Any:
+    """
+    Return the value cached under ``key`` for the current version, computing
+    and storing it on a miss. Concurrent misses in this process share one
+    ``compute()`` call.
+    """
+    cache = _cache()
+    versioned_key: str = f'matches:{get_version()}:{key}'
+    value: Any = cache.get(versioned_key)
+    if value is not None:
+        return value
+
+    def fill() -> Any:
+        value: Any = cache.get(versioned_key)
+        if value is None:
+            value = compute()
+            cache.set(versioned_key, value)
+        return value
+
+    return _flight.do(versioned_key, fill)
@@ -0,0 +1,38 @@
+"""
+Worker-process side of ``manage.py build_matches``.
+
+Kept free of module-level Django imports so it can be loaded by spawned
+worker processes, which set Django up in ``init_worker`` before touching any
+model code.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+_index: Optional[Any] = None
+
+
+def init_worker(state: Dict[str, Any]) -> None:
+    """
+    Process-pool initializer: rebuild the parent's hobby index snapshot.
+    """
+    global _index
+    import django
+    django.setup()
+    from api.hobby_index import HobbyIndex
+
+    index = HobbyIndex.__new__(HobbyIndex)
+    index.__setstate__(state)
+    _index = index
+
+
+def compute_matches(user_ids: List[int], top_k: int, index: Optional[Any] = None) -> List[Tuple[int, int, int, int]]:
+    """
+    Return ``(user_id, candidate_id, common_hobbies, candidate_dob ordinal)``
+    rows for the ``top_k`` best matches of each of ``user_ids``, across all ages.
+    """
+    index = index or _index
+    rows: List[Tuple[int, int, int, int]] = []
+    for user_id in user_ids:
+        for candidate_id, common_hobbies in index.rank(user_id, date.min, date.max)[:top_k]:
+            rows.append((user_id, candidate_id, common_hobbies, index.birthdate(candidate_id)))
+    return rows
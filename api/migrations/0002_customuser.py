@@ -13,6 +13,12 @@ class Migration(migrations.Migration):
         ('auth', '0012_alter_user_first_name_max_length'),
     ]
 
+    # admin.0001 depends on AUTH_USER_MODEL, which resolves to api.0001 (the
+    # first migration of this app) even though the user table is created here.
+    run_before = [
+        ('admin', '0001_initial'),
+    ]
+
     operations = [
         migrations.CreateModel(
             name='CustomUser',
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:30
+
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+
+
+def canonicalize_friendships(apps, schema_editor):
+    """
+    Store each friendship once, as (lower id, higher id).
+
+    Pairs stored in both directions lose their reversed row; the remaining
+    reversed rows are swapped in batches (a single UPDATE swapping both
+    columns is not portable to MySQL).
+    """
+    Friendship = apps.get_model('api', 'Friendship')
+    Friendship.objects.filter(user1=F('user2')).delete()
+    Friendship.objects.filter(
+        Exists(Friendship.objects.filter(user1=OuterRef('user2'), user2=OuterRef('user1'))),
+        user1__gt=F('user2'),
+    ).delete()
+    reversed_rows = Friendship.objects.filter(user1__gt=F('user2')).only('id', 'user1', 'user2')
+    while True:
+        batch = list(reversed_rows[:1000])
+        if not batch:
+            break
+        for friendship in batch:
+            friendship.user1_id, friendship.user2_id = friendship.user2_id, friendship.user1_id
+        Friendship.objects.bulk_update(batch, ['user1', 'user2'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_similarusermatch'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lt', models.F('user2'))), name='api_friendship_canonical_order'),
+        ),
+    ]
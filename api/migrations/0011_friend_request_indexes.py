@@ -0,0 +1,60 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def delete_duplicate_pending_requests(apps, schema_editor):
+    """
+    Keep only the oldest pending request per (sender, receiver) pair, so the
+    unique pending constraint can be added.
+    """
+    FriendRequest = apps.get_model('api', 'FriendRequest')
+    FriendRequest.objects.filter(
+        Exists(FriendRequest.objects.filter(
+            sender=OuterRef('sender'), receiver=OuterRef('receiver'), status='pending', id__lt=OuterRef('id'),
+        )),
+        status='pending',
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_friendship_canonical_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='date_of_birth',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        # Composite indexes are created before the single-column foreign key
+        # indexes they replace are dropped (MySQL requires FKs to be indexed).
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user2', 'user1'], name='api_friendship_user2_user1_idx'),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='user2',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='friendship_receiver', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['receiver', 'status', '-timestamp', '-id'], name='api_freq_receiver_status_idx'),
+        ),
+        migrations.AlterField(
+            model_name='friendrequest',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='received_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(delete_duplicate_pending_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('sender', 'receiver'), name='api_friendrequest_unique_pending'),
+        ),
+    ]
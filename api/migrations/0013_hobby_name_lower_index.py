@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:44
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hobby',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='api_hobby_name_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:49
+
+from collections import defaultdict
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Copied from ``Hobby.normalize_name`` so this migration keeps doing the same
+# thing whatever later happens to the model.
+def normalize_name(name):
+    return ' '.join(name.split())
+
+
+def merge_duplicate_hobbies(apps, schema_editor):
+    """
+    Merge hobbies whose names differ only in case or whitespace into the
+    oldest of them and store normalized names, so the case-insensitive unique
+    constraint can be added. ``manage.py merge_hobbies`` does the same on a
+    live database, batching the moves and updating caches and indexes.
+    """
+    Hobby = apps.get_model('api', 'Hobby')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    Tombstone = apps.get_model('api', 'Tombstone')
+    through = CustomUser.hobbies.through
+
+    groups = defaultdict(list)
+    for hobby_id, name in Hobby.objects.order_by('id').values_list('id', 'name').iterator():
+        groups[normalize_name(name).lower()].append(hobby_id)
+    for keeper_id, *duplicate_ids in (ids for ids in groups.values() if len(ids) > 1):
+        rows = through.objects.filter(hobby_id__in=duplicate_ids)
+        user_ids = set(rows.values_list('customuser_id', flat=True))
+        # Users with several spellings end up with one keeper row.
+        through.objects.bulk_create(
+            [through(customuser_id=user_id, hobby_id=keeper_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        rows.delete()
+        Hobby.objects.filter(id__in=duplicate_ids).delete()
+        Tombstone.objects.bulk_create([Tombstone(kind='hobby', object_id=hobby_id) for hobby_id in duplicate_ids])
+        # Incremental build_matches runs pick up users whose hobbies changed.
+        CustomUser.objects.filter(pk__in=user_ids).update(hobbies_updated_at=timezone.now())
+
+    for hobby_id, name in list(Hobby.objects.values_list('id', 'name')):
+        if normalize_name(name) != name:
+            Hobby.objects.filter(id=hobby_id).update(name=normalize_name(name), updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_hobby_name_lower_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_hobbies, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='hobby',
+            name='api_hobby_name_lower_idx',
+        ),
+        migrations.AlterField(
+            model_name='hobby',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='hobby',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='api_hobby_name_ci_unique'),
+        ),
+    ]
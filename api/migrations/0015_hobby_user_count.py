@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_hobby_users(apps, schema_editor):
+    Hobby = apps.get_model('api', 'Hobby')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    Hobby.objects.update(user_count=Coalesce(Subquery(
+        CustomUser.hobbies.through.objects.filter(hobby_id=OuterRef('pk'))
+                                          .values('hobby_id')
+                                          .annotate(count=Count('*'))
+                                          .values('count')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_hobby_name_ci_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hobby',
+            name='user_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_hobby_users, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='hobby',
+            index=models.Index(fields=['-user_count', 'id'], name='api_hobby_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_hobby_user_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MinHashSignature',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='minhash', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('signature', models.BinaryField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,244 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Q
+
+from api.hobby_index import read_users
+from api.models import CustomUser, MinHashSignature
+
+# Hobby ids are hashed modulo this Mersenne prime.
+_PRIME: int = (1 << 31) - 1
+# Changing the seed or MINHASH_PERMUTATIONS invalidates stored signatures;
+# run ``manage.py build_minhash`` (without --incremental) afterwards.
+_SEED: int = 0x5EED
+
+
+class MinHasher:
+    """
+    ``permutations`` hash functions ``(a * x + b) mod p`` over hobby ids, and
+    the banding that turns a signature into one LSH bucket key per band.
+
+    Two users collide in a band when all its ``permutations / bands`` minimums
+    agree, which happens with probability ``J ** rows`` for hobby sets of
+    Jaccard similarity ``J``: more bands find weaker matches.
+    """
+
+    def __init__(self, permutations: int, bands: int) -> None:
+        if permutations % bands:
+            raise ValueError('MINHASH_PERMUTATIONS must be a multiple of MINHASH_BANDS.')
+        rng = np.random.default_rng(_SEED)
+        self.permutations: int = permutations
+        self.bands: int = bands
+        self._a: np.ndarray = rng.integers(1, _PRIME, permutations, dtype=np.int64)
+        self._b: np.ndarray = rng.integers(0, _PRIME, permutations, dtype=np.int64)
+        # Odd multipliers folding the rows of a band into one 64-bit key.
+        self._fold: np.ndarray = rng.integers(1, 1 << 63, permutations // bands, dtype=np.uint64) | np.uint64(1)
+
+    def signatures(self, memberships: np.ndarray, chunk_users: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return ``(user_ids, signatures)`` for ``(user_id, hobby_id)`` rows
+        sorted by user id: one row of ``permutations`` uint32 minimums per user.
+        """
+        users, starts = np.unique(memberships[:, 0], return_index=True)
+        hobbies: np.ndarray = memberships[:, 1] % _PRIME
+        signatures = np.empty((len(users), self.permutations), dtype=np.uint32)
+        bounds: np.ndarray = np.append(starts, len(memberships))
+        # Hashed a slice of users at a time so the rows x permutations matrix stays small.
+        for first in range(0, len(users), chunk_users):
+            last: int = min(first + chunk_users, len(users))
+            lo, hi = bounds[first], bounds[last]
+            hashed = (hobbies[lo:hi, None] * self._a + self._b) % _PRIME
+            signatures[first:last] = np.minimum.reduceat(hashed, starts[first:last] - lo, axis=0)
+        return users, signatures
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        Fold ``signatures`` into a ``(users, bands)`` uint64 key matrix.
+        """
+        rows = signatures.reshape(len(signatures), self.bands, len(self._fold)).astype(np.uint64)
+        # uint64 arithmetic wraps, which is fine for hashing.
+        return (rows * self._fold).sum(axis=2, dtype=np.uint64)
+
+
+def read_memberships(users: Union[Iterable[int], Q]) -> np.ndarray:
+    """
+    Return ``(user_id, hobby_id)`` rows sorted by user id, for a list of user
+    ids or a ``Q`` filter on users.
+    """
+    through = CustomUser.hobbies.through
+    if isinstance(users, Q):
+        rows = through.objects.filter(customuser__in=CustomUser.objects.filter(users))
+    else:
+        rows = through.objects.filter(customuser_id__in=list(users))
+    return np.array(
+        list(rows.order_by('customuser_id').values_list('customuser_id', 'hobby_id').iterator()), dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def stale_signatures() -> Q:
+    """
+    Users whose stored signature is missing or older than their hobbies.
+    """
+    return Q(minhash__isnull=True) | Q(hobbies_updated_at__gt=F('minhash__computed_at'))
+
+
+class MinHashIndex:
+    """
+    Locality-sensitive hashing index over users' hobby sets.
+
+    Each band keeps its bucket keys sorted next to the rows they belong to,
+    so the users colliding with a requester are a ``searchsorted`` per band.
+    Candidates are returned by number of colliding bands, which estimates
+    their similarity; callers re-score them exactly.
+
+    Updates from the signals in ``api.signals`` go to a small pending map
+    that is searched linearly and merged into the sorted arrays once it
+    grows, like the edge overlay of ``api.friend_graph.FriendGraph``.
+    """
+
+    def __init__(self, hasher: MinHasher) -> None:
+        self._lock = threading.RLock()
+        self.hasher: MinHasher = hasher
+        self._set_base(np.zeros(0, dtype=np.int64), np.zeros((0, hasher.bands), dtype=np.uint64))
+
+    def _set_base(self, ids: np.ndarray, keys: np.ndarray) -> None:
+        orders: List[np.ndarray] = [np.argsort(keys[:, band], kind='stable') for band in range(self.hasher.bands)]
+        self._ids: np.ndarray = ids
+        self._keys: np.ndarray = keys
+        self._alive: np.ndarray = np.ones(len(ids), dtype=bool)
+        self._rows: Dict[int, int] = {user_id: row for row, user_id in enumerate(ids.tolist())}
+        self._sorted_keys: List[np.ndarray] = [keys[order, band] for band, order in enumerate(orders)]
+        self._sorted_rows: List[np.ndarray] = orders
+        self._pending: Dict[int, np.ndarray] = {}
+
+    def load(self) -> None:
+        """
+        (Re)build the index from the signatures stored by ``build_minhash``,
+        computing missing or stale ones from the user's hobbies.
+        """
+        size: int = 4 * self.hasher.permutations
+        stored = list(
+            MinHashSignature.objects.filter(
+                Q(user__hobbies_updated_at__isnull=True) | Q(user__hobbies_updated_at__lte=F('computed_at'))
+            ).order_by('user_id').values_list('user_id', 'signature').iterator()
+        )
+        if all(len(signature) == size for _, signature in stored):
+            stored_ids = np.array([user_id for user_id, _ in stored], dtype=np.int64)
+            stored_signatures = np.frombuffer(
+                b''.join(bytes(signature) for _, signature in stored), dtype='<u4'
+            ).reshape(-1, self.hasher.permutations)
+            memberships: np.ndarray = read_memberships(stale_signatures())
+        else:
+            # Built with other settings: recompute everything.
+            stored_ids = np.zeros(0, dtype=np.int64)
+            stored_signatures = np.zeros((0, self.hasher.permutations), dtype=np.uint32)
+            memberships = read_memberships(Q())
+        ids, signatures = self.hasher.signatures(memberships)
+        ids = np.concatenate((stored_ids, ids))
+        keys: np.ndarray = self.hasher.band_keys(np.concatenate((stored_signatures, signatures)))
+        with self._lock:
+            self._set_base(ids, keys)
+
+    def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """
+        Recompute the signatures of ``user_ids`` from their current hobbies.
+        """
+        users = read_users(user_ids)
+        memberships = np.array(
+            [(user_id, hobby_id) for user_id, state in sorted(users.items()) if state for hobby_id in state[1]],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        ids, signatures = self.hasher.signatures(memberships)
+        keys: Dict[int, np.ndarray] = dict(zip(ids.tolist(), self.hasher.band_keys(signatures)))
+        with self._lock:
+            for user_id in users:
+                row: Optional[int] = self._rows.get(user_id)
+                if row is not None:
+                    self._alive[row] = False
+                if user_id in keys:
+                    self._pending[user_id] = keys[user_id]
+                else:
+                    self._pending.pop(user_id, None)
+            if len(self._pending) > max(1024, len(self._ids) // 16):
+                self._merge_pending()
+
+    def remove_hobby(self, hobby_id: int) -> None:
+        # Signatures still holding the hobby only cause extra candidates,
+        # which exact re-scoring drops; the users' hobbies_updated_at was
+        # bumped, so the next build_minhash --incremental recomputes them.
+        pass
+
+    def _merge_pending(self) -> None:
+        alive: np.ndarray = np.flatnonzero(self._alive)
+        ids = np.concatenate((self._ids[alive], np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))))
+        keys = np.concatenate((self._keys[alive], np.array(list(self._pending.values()), dtype=np.uint64)
+                               .reshape(-1, self.hasher.bands)))
+        self._set_base(ids, keys)
+
+    def candidates(self, user_id: int, limit: int) -> List[int]:
+        """
+        Return up to ``limit`` users sharing a bucket with ``user_id``, most
+        colliding bands first, then by id.
+        """
+        with self._lock:
+            keys: Optional[np.ndarray] = self._pending.get(user_id)
+            if keys is None:
+                row: Optional[int] = self._rows.get(user_id)
+                if row is None or not self._alive[row]:
+                    return []
+                keys = self._keys[row]
+            found: List[np.ndarray] = []
+            for band in range(self.hasher.bands):
+                sorted_keys = self._sorted_keys[band]
+                lo: int = np.searchsorted(sorted_keys, keys[band], 'left')
+                hi: int = np.searchsorted(sorted_keys, keys[band], 'right')
+                found.append(self._sorted_rows[band][lo:hi])
+            rows: np.ndarray = np.concatenate(found)
+            ids: np.ndarray = self._ids[rows[self._alive[rows]]]
+            if self._pending:
+                pending_ids = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+                collisions = (np.array(list(self._pending.values())) == keys).sum(axis=1)
+                ids = np.concatenate((ids, np.repeat(pending_ids, collisions)))
+
+        candidates, counts = np.unique(ids, return_counts=True)
+        keep = candidates != user_id
+        candidates, counts = candidates[keep], counts[keep]
+        order: np.ndarray = np.lexsort((candidates, -counts))[:limit]
+        return candidates[order].tolist()
+
+
+def build_hasher() -> MinHasher:
+    return MinHasher(settings.MINHASH_PERMUTATIONS, settings.MINHASH_BANDS)
+
+
+_index: Optional[MinHashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_minhash_index() -> MinHashIndex:
+    """
+    Return the process-wide index, building it on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = MinHashIndex(build_hasher())
+                index.load()
+                _index = index
+    return _index
+
+
+def get_loaded_minhash_index() -> Optional[MinHashIndex]:
+    """
+    Return the process-wide index if it has been built, without building it.
+    """
+    return _index
+
+
+def reset_minhash_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
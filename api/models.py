@@ -1,16 +1,48 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from django.db.models.query import QuerySet
 from django.db import models
+from django.db.models import DEFERRED, Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
 class Hobby(models.Model):
-    name: str = models.CharField(max_length=100, unique=True)
+    # Stored normalized (see ``normalize_name``) and unique ignoring case.
+    name: str = models.CharField(max_length=100)
     description: str = models.TextField(blank=True)
+    updated_at: models.DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
+    # Number of users with this hobby, kept current by api.signals and
+    # corrected by ``manage.py reconcile_hobby_counts``.
+    user_count: int = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Also serves the prefix range scans of api.hobby_search.search_database.
+        constraints: list = [models.UniqueConstraint(Lower('name'), name='api_hobby_name_ci_unique')]
+        indexes: list = [models.Index(fields=['-user_count', 'id'], name='api_hobby_popular_idx')]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        self.name = Hobby.normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """
+        Return ``name`` with surrounding whitespace stripped and inner runs
+        collapsed to a single space, the form hobby names are stored in.
+        """
+        return ' '.join(name.split())
+
+    @staticmethod
+    def name_key(name: str) -> str:
+        """
+        Identity of a hobby name: normalized and lower-cased, the Python side
+        of the ``LOWER(name)`` unique constraint.
+        """
+        return Hobby.normalize_name(name).lower()
+
     def as_dict(self) -> Dict[str, Any]:
         return {
             'id': self.id,
@@ -18,63 +50,165 @@ class Hobby(models.Model):
             'description': self.description,
         }
 
+    @staticmethod
+    def reconcile_user_counts(hobby_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Recount ``user_count`` from the through table for ``hobby_ids`` (all
+        hobbies by default) in one ``UPDATE``, touching only the counters that
+        drifted. Returns the number of hobbies corrected.
+        """
+        actual = Coalesce(Subquery(
+            CustomUser.hobbies.through.objects.filter(hobby_id=OuterRef('pk'))
+                                              .values('hobby_id')
+                                              .annotate(count=Count('*'))
+                                              .values('count')
+        ), 0)
+        hobbies: QuerySet = Hobby.objects.all()
+        if hobby_ids is not None:
+            hobbies = hobbies.filter(id__in=list(hobby_ids))
+        return hobbies.annotate(actual=actual).exclude(user_count=F('actual')).update(user_count=actual)
+
 class CustomUser(AbstractUser):
-    date_of_birth: models.DateField = models.DateField(null=True, blank=True)
+    date_of_birth: models.DateField = models.DateField(null=True, blank=True, db_index=True)
     hobbies: models.ManyToManyField = models.ManyToManyField(Hobby, blank=True)
     friends: models.ManyToManyField = models.ManyToManyField(
         'self', through='Friendship', symmetrical=False, related_name='related_friends'
     )
+    # Last change to hobbies or date of birth; drives incremental match builds.
+    hobbies_updated_at: models.DateTimeField = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Last full save (profile edits); lets /api/sync/ resend rows that show
+    # this user's name or email.
+    updated_at: models.DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db: Any, field_names: Any, values: Any) -> 'CustomUser':
+        user = super().from_db(db, field_names, values)
+        # Lets ``api.signals.user_saved`` tell whether a save changed it.
+        user._loaded_date_of_birth = user.__dict__.get('date_of_birth', DEFERRED)
+        return user
 
     def __str__(self) -> str:
         return f"{self.first_name} {self.last_name}"
 
     def as_dict(self) -> Dict[str, Any]:
-        dob = self.date_of_birth.strftime('%d/%m/%Y') if self.date_of_birth else None
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'first_name': self.first_name,
-            'last_name': self.last_name,
-            'dateOfBirth': dob,
-            'hobbies': [h.as_dict() for h in self.hobbies.all()],
-            'friends': [
-                {'id': friend.id, 'username': friend.username, 'email': friend.email}
-                for friend in self.get_friends()
-            ],
-        }
+        return CustomUser.as_dicts([self])[0]
+
+    @staticmethod
+    def as_dicts(users: List['CustomUser'], include_friends: bool = True) -> List[Dict[str, Any]]:
+        """
+        Serialize ``users`` with their hobbies and friends in at most two
+        queries, however many users there are. ``include_friends=False``
+        leaves out the friend list and its query.
+
+        Hobbies come from ``prefetch_related('hobbies')`` when every user has
+        them prefetched, and otherwise from one through-table query. Friends
+        are read as (id, username, email) tuples from one Friendship query
+        joined to both users, without building model instances.
+        """
+        user_ids: List[int] = [user.id for user in users]
+        hobbies: Dict[int, List[Dict[str, Any]]] = {user_id: [] for user_id in user_ids}
+        if all('hobbies' in getattr(user, '_prefetched_objects_cache', {}) for user in users):
+            for user in users:
+                hobbies[user.id] = [h.as_dict() for h in user.hobbies.all()]
+        else:
+            rows = (
+                CustomUser.hobbies.through.objects.filter(customuser_id__in=user_ids)
+                                                  .order_by('hobby_id')
+                                                  .values_list('customuser_id', 'hobby_id', 'hobby__name',
+                                                               'hobby__description')
+            )
+            for user_id, hobby_id, name, description in rows:
+                hobbies[user_id].append({'id': hobby_id, 'name': name, 'description': description})
+
+        friends: Dict[int, List[Dict[str, Any]]] = {user_id: [] for user_id in user_ids}
+        if include_friends:
+            rows = (
+                Friendship.objects.filter(Q(user1_id__in=user_ids) | Q(user2_id__in=user_ids))
+                                  .order_by('user1_id', 'user2_id')
+                                  .values_list('user1_id', 'user1__username', 'user1__email',
+                                               'user2_id', 'user2__username', 'user2__email')
+            )
+            for user1_id, user1_username, user1_email, user2_id, user2_username, user2_email in rows:
+                if user1_id in friends:
+                    friends[user1_id].append({'id': user2_id, 'username': user2_username, 'email': user2_email})
+                if user2_id in friends:
+                    friends[user2_id].append({'id': user1_id, 'username': user1_username, 'email': user1_email})
+
+        serialized: List[Dict[str, Any]] = []
+        for user in users:
+            data: Dict[str, Any] = {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'dateOfBirth': user.date_of_birth.strftime('%d/%m/%Y') if user.date_of_birth else None,
+                'hobbies': hobbies[user.id],
+            }
+            if include_friends:
+                data['friends'] = sorted(friends[user.id], key=lambda friend: friend['id'])
+            serialized.append(data)
+        return serialized
+
+    def get_friend_count(self) -> int:
+        return Friendship.objects.filter(Q(user1=self) | Q(user2=self)).count()
 
     def get_friends(self) -> QuerySet:
         """
-        Returns a queryset of all the user's friends.
+        Returns a lazy queryset of all the user's friends, resolved in a
+        single query with one subquery per side of the friendship.
         """
-        friendships: QuerySet = Friendship.objects.filter(user1=self) | Friendship.objects.filter(user2=self)
-        friend_ids: set[int] = set()
-        for friendship in friendships:
-            friend_ids.add(friendship.user1_id if friendship.user2_id == self.id else friendship.user2_id)
-        return CustomUser.objects.filter(id__in=friend_ids)
+        return CustomUser.objects.filter(
+            Q(id__in=Friendship.objects.filter(user1=self).values('user2'))
+            | Q(id__in=Friendship.objects.filter(user2=self).values('user1'))
+        )
 
 class Friendship(models.Model):
+    """
+    One row per pair of friends, stored canonically with ``user1_id < user2_id``.
+    """
     user1: models.ForeignKey = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name='friendship_initiator', on_delete=models.CASCADE
     )
+    # Indexed by the (user2, user1) index below, which also covers reverse lookups.
     user2: models.ForeignKey = models.ForeignKey(
-        settings.AUTH_USER_MODEL, related_name='friendship_receiver', on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL, related_name='friendship_receiver', on_delete=models.CASCADE, db_index=False
     )
     created_at: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+    updated_at: models.DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together: tuple = ('user1', 'user2')
+        constraints: list = [
+            models.CheckConstraint(condition=Q(user1__lt=F('user2')), name='api_friendship_canonical_order'),
+        ]
+        indexes: list = [models.Index(fields=['user2', 'user1'], name='api_friendship_user2_user1_idx')]
 
     def __str__(self) -> str:
         return f"{self.user1} ↔ {self.user2}"
 
+    @staticmethod
+    def pair(user_a_id: int, user_b_id: int) -> Tuple[int, int]:
+        """
+        Return the canonical ``(user1_id, user2_id)`` for two user ids.
+        """
+        return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+    @classmethod
+    def befriend(cls, user_a: 'CustomUser', user_b: 'CustomUser') -> Tuple['Friendship', bool]:
+        """
+        Get or create the friendship between two users, in canonical order.
+        """
+        user1_id, user2_id = cls.pair(user_a.pk, user_b.pk)
+        return cls.objects.get_or_create(user1_id=user1_id, user2_id=user2_id)
+
 class FriendRequest(models.Model):
     sender: models.ForeignKey = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name='sent_requests', on_delete=models.CASCADE
     )
+    # Indexed by the (receiver, status, ...) index below.
     receiver: models.ForeignKey = models.ForeignKey(
-        settings.AUTH_USER_MODEL, related_name='received_requests', on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL, related_name='received_requests', on_delete=models.CASCADE, db_index=False
     )
     status: str = models.CharField(
         max_length=10,
@@ -82,6 +216,91 @@ class FriendRequest(models.Model):
         default='pending',
     )
     timestamp: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+    updated_at: models.DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # At most one pending request per direction. Partial constraints are
+        # not supported (and skipped) on MySQL.
+        constraints: list = [
+            models.UniqueConstraint(
+                fields=['sender', 'receiver'], condition=Q(status='pending'), name='api_friendrequest_unique_pending'
+            ),
+        ]
+        indexes: list = [
+            models.Index(fields=['receiver', 'status', '-timestamp', '-id'], name='api_freq_receiver_status_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.sender} → {self.receiver} ({self.status})"
+
+class SimilarUserMatch(models.Model):
+    """
+    A precomputed top-K match for ``user``, written by ``manage.py build_matches``.
+    """
+    user: models.ForeignKey = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='similar_matches', on_delete=models.CASCADE
+    )
+    candidate: models.ForeignKey = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE
+    )
+    common_hobbies: int = models.PositiveIntegerField()
+    candidate_dob: models.DateField = models.DateField()
+
+    class Meta:
+        unique_together: tuple = ('user', 'candidate')
+        indexes: list = [models.Index(fields=['user', 'candidate_dob'], name='api_match_user_dob_idx')]
+
+    def __str__(self) -> str:
+        return f"{self.user} ~ {self.candidate} ({self.common_hobbies})"
+
+class MatchBuild(models.Model):
+    """
+    A run of ``manage.py build_matches``; incremental runs start from the last one.
+    """
+    started_at: models.DateTimeField = models.DateTimeField()
+    finished_at: models.DateTimeField = models.DateTimeField(null=True, blank=True)
+    incremental: bool = models.BooleanField(default=False)
+    users_built: int = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"Match build {self.started_at:%Y-%m-%d %H:%M} ({self.users_built} users)"
+
+class MinHashSignature(models.Model):
+    """
+    A user's MinHash signature over their hobby ids, written by
+    ``manage.py build_minhash`` so the LSH index (``api.minhash_index``) can
+    load without recomputing it. Stale once ``user.hobbies_updated_at`` passes
+    ``computed_at``.
+    """
+    user: models.OneToOneField = models.OneToOneField(
+        settings.AUTH_USER_MODEL, primary_key=True, related_name='minhash', on_delete=models.CASCADE
+    )
+    # Little-endian uint32 values, MINHASH_PERMUTATIONS of them.
+    signature: bytes = models.BinaryField()
+    computed_at: models.DateTimeField = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"MinHash of {self.user_id} at {self.computed_at}"
+
+class Tombstone(models.Model):
+    """
+    Record of a deleted row, so ``/api/sync/`` can tell clients to drop it.
+
+    ``user_id`` is the user who should hear about the deletion, or null for
+    rows every user sees (hobbies). It is a plain integer rather than a
+    foreign key so tombstones outlive the users they belong to.
+    """
+    KIND_HOBBY: str = 'hobby'
+    KIND_FRIEND_REQUEST: str = 'friend_request'
+    KIND_FRIEND: str = 'friend'
+
+    kind: str = models.CharField(max_length=20)
+    object_id: int = models.BigIntegerField()
+    user_id: int = models.BigIntegerField(null=True, blank=True)
+    deleted_at: models.DateTimeField = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes: list = [models.Index(fields=['user_id', 'deleted_at'], name='api_tombstone_user_idx')]
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
@@ -0,0 +1,237 @@
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DEFERRED, F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api import (
+    bitset_engine, events, friend_graph, hobby_catalog, hobby_index, hobby_search, match_cache, minhash_index,
+)
+from api.models import CustomUser, FriendRequest, Friendship, Hobby, Tombstone
+
+
+def _loaded_engines() -> List[Any]:
+    engines = [
+        hobby_index.get_loaded_index(), bitset_engine.get_loaded_engine(), minhash_index.get_loaded_minhash_index(),
+    ]
+    return [engine for engine in engines if engine is not None]
+
+
+def _refresh_engines(user_ids: Iterable[int]) -> None:
+    """
+    Refresh ``user_ids`` in the in-process matching engines once the
+    transaction commits, so rolled-back changes never reach them. Engines that
+    have not been built yet are skipped.
+    """
+    engines: List[Any] = _loaded_engines()
+    if not engines:
+        return
+    user_ids = set(user_ids)
+
+    def refresh() -> None:
+        for engine in engines:
+            engine.refresh_users(user_ids)
+
+    transaction.on_commit(refresh)
+
+
+def _hobbies_changed(user_ids: Iterable[int], refresh: bool = True) -> None:
+    """
+    Record that the hobbies or date of birth of ``user_ids`` changed, and
+    refresh them in the in-process engines unless ``refresh`` is False.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    CustomUser.objects.filter(pk__in=user_ids).update(hobbies_updated_at=timezone.now())
+    if settings.MATCH_CACHE_ENABLED:
+        transaction.on_commit(match_cache.bump_version)
+    if refresh:
+        _refresh_engines(user_ids)
+
+
+def hobby_memberships_moved(user_ids: Iterable[int]) -> None:
+    """
+    Record hobby changes for ``user_ids`` after their through-table rows were
+    rewritten with bulk queries, which send no ``m2m_changed``.
+    """
+    _hobbies_changed(user_ids)
+
+
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def user_hobbies_changed(
+    sender: Any, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any
+) -> None:
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            _hobbies_changed([instance.pk])
+    elif action == 'pre_clear':
+        # The affected users are only known before the rows are deleted.
+        _hobbies_changed(instance.customuser_set.values_list('id', flat=True))
+    elif pk_set:
+        _hobbies_changed(pk_set)
+
+
+def _adjust_user_counts(hobby_ids: Iterable[int], delta: int) -> None:
+    hobby_ids = list(hobby_ids)
+    if hobby_ids and delta:
+        # Clamped at zero so a drifted counter never breaks a request;
+        # reconcile_hobby_counts fixes the drift.
+        Hobby.objects.filter(id__in=hobby_ids).update(user_count=Greatest(F('user_count') + delta, 0))
+
+
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def hobby_user_counts_changed(
+    sender: Any, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any
+) -> None:
+    """
+    Keep ``Hobby.user_count`` current with ``F()`` updates. ``post_add``
+    reports only the rows actually added, but ``remove`` reports every id it
+    was given, so removals count the existing rows first.
+    """
+    if action == 'post_add' and pk_set:
+        if reverse:
+            _adjust_user_counts([instance.pk], len(pk_set))
+        else:
+            _adjust_user_counts(pk_set, 1)
+    elif action == 'pre_remove' and pk_set:
+        if reverse:
+            removed: int = sender.objects.filter(hobby_id=instance.pk, customuser_id__in=pk_set).count()
+            _adjust_user_counts([instance.pk], -removed)
+        else:
+            rows = sender.objects.filter(customuser_id=instance.pk, hobby_id__in=pk_set)
+            _adjust_user_counts(rows.values_list('hobby_id', flat=True), -1)
+    elif action == 'pre_clear':
+        if reverse:
+            Hobby.objects.filter(pk=instance.pk).update(user_count=0)
+        else:
+            _adjust_user_counts(sender.objects.filter(customuser_id=instance.pk).values_list('hobby_id', flat=True), -1)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(
+    sender: Any, instance: CustomUser, created: bool = False, update_fields: Optional[Any] = None, **kwargs: Any
+) -> None:
+    # Only the date of birth affects matching. ``CustomUser.from_db`` keeps
+    # the loaded value; instances not read from the database (or with the
+    # field deferred) are assumed to have changed it.
+    if update_fields is not None and 'date_of_birth' not in update_fields:
+        return
+    loaded: Any = getattr(instance, '_loaded_date_of_birth', DEFERRED)
+    instance._loaded_date_of_birth = instance.date_of_birth
+    if not created and loaded is not DEFERRED and loaded == instance.date_of_birth:
+        return
+    _hobbies_changed([instance.pk])
+
+
+@receiver(pre_delete, sender=CustomUser)
+def user_deleting(sender: Any, instance: CustomUser, **kwargs: Any) -> None:
+    # The cascade to the through table sends no m2m_changed.
+    _adjust_user_counts(instance.hobbies.values_list('id', flat=True), -1)
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender: Any, instance: CustomUser, **kwargs: Any) -> None:
+    if settings.MATCH_CACHE_ENABLED:
+        transaction.on_commit(match_cache.bump_version)
+    _refresh_engines([instance.pk])
+
+
+@receiver(pre_delete, sender=Hobby)
+def hobby_deleting(sender: Any, instance: Hobby, **kwargs: Any) -> None:
+    # Deleting a hobby cascades to the through table without m2m_changed.
+    # The engines drop the whole column in ``hobby_deleted`` instead.
+    _hobbies_changed(instance.customuser_set.values_list('id', flat=True), refresh=False)
+
+
+def hobbies_created(hobbies: List[Hobby]) -> None:
+    """
+    Publish new or renamed ``hobbies`` to the catalog cache and the search
+    index once the transaction commits. ``bulk_create`` sends no
+    ``post_save``, so bulk inserts call this directly.
+    """
+    if not hobbies:
+        return
+    transaction.on_commit(hobby_catalog.bump_version)
+    index: Optional[hobby_search.HobbySearchIndex] = hobby_search.get_loaded_search_index()
+    if index is not None:
+        names: List[Tuple[int, str]] = [(hobby.pk, hobby.name) for hobby in hobbies]
+
+        def update_index() -> None:
+            for hobby_id, name in names:
+                index.set(hobby_id, name)
+
+        transaction.on_commit(update_index)
+
+
+@receiver(post_save, sender=Hobby)
+def hobby_saved(sender: Any, instance: Hobby, **kwargs: Any) -> None:
+    hobbies_created([instance])
+
+
+@receiver(post_delete, sender=Hobby)
+def hobby_deleted(sender: Any, instance: Hobby, **kwargs: Any) -> None:
+    hobby_id: int = instance.pk
+    Tombstone.objects.create(kind=Tombstone.KIND_HOBBY, object_id=hobby_id)
+    transaction.on_commit(hobby_catalog.bump_version)
+    index: Optional[hobby_search.HobbySearchIndex] = hobby_search.get_loaded_search_index()
+    if index is not None:
+        transaction.on_commit(lambda: index.remove(hobby_id))
+    for engine in _loaded_engines():
+        transaction.on_commit(lambda engine=engine: engine.remove_hobby(hobby_id))
+
+
+def friendships_created(pairs: List[Tuple[int, int]]) -> None:
+    """
+    Add ``(user1_id, user2_id)`` friendships to the loaded friend graph once
+    the transaction commits. ``bulk_create`` sends no ``post_save``, so bulk
+    inserts call this directly.
+    """
+    graph: Optional[friend_graph.FriendGraph] = friend_graph.get_loaded_graph()
+    if pairs and graph is not None:
+        transaction.on_commit(lambda: graph.add_edges(pairs))
+
+
+@receiver(post_save, sender=Friendship)
+def friendship_saved(sender: Any, instance: Friendship, created: bool, **kwargs: Any) -> None:
+    if created:
+        friendships_created([(instance.user1_id, instance.user2_id)])
+
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender: Any, instance: Friendship, **kwargs: Any) -> None:
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=Tombstone.KIND_FRIEND, user_id=instance.user1_id, object_id=instance.user2_id),
+        Tombstone(kind=Tombstone.KIND_FRIEND, user_id=instance.user2_id, object_id=instance.user1_id),
+    ])
+    # Deletions are rare (users leaving); reload the graph on next use.
+    graph: Optional[friend_graph.FriendGraph] = friend_graph.get_loaded_graph()
+    if graph is not None:
+        transaction.on_commit(lambda: setattr(graph, 'stale', True))
+
+
+@receiver(post_save, sender=FriendRequest)
+def friend_request_saved(
+    sender: Any, instance: FriendRequest, created: bool, update_fields: Optional[Any] = None, **kwargs: Any
+) -> None:
+    # Bulk paths bypass this signal and call events.publish_on_commit themselves.
+    if not created and (instance.status == 'pending' or (update_fields and 'status' not in update_fields)):
+        return
+    events.publish_on_commit([events.friend_request_event(
+        'created' if created else instance.status, instance.id, instance.sender_id, instance.sender.username,
+        instance.receiver_id, instance.timestamp,
+    )])
+
+
+@receiver(post_delete, sender=FriendRequest)
+def friend_request_deleted(sender: Any, instance: FriendRequest, **kwargs: Any) -> None:
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=Tombstone.KIND_FRIEND_REQUEST, user_id=user_id, object_id=instance.pk)
+        for user_id in (instance.sender_id, instance.receiver_id)
+    ])
@@ -1,3 +1,1162 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import threading
+import time
+from base64 import urlsafe_b64encode
+from datetime import date, timedelta
+from unittest import mock
+from io import StringIO
+from typing import Any, Dict, List, Tuple
 
-# Create your tests here.
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import bitset_engine, events, friend_graph, hobby_index, hobby_search, match_cache, minhash_index
+from .models import CustomUser, FriendRequest, Friendship, Hobby, MatchBuild, MinHashSignature, Tombstone
+from .utils import encode_sync_token, get_similar_users, mutual_friend_counts
+
+
+def make_user(username: str, age: int = 25, hobbies: tuple = ()) -> CustomUser:
+    user: CustomUser = CustomUser.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        date_of_birth=date.today() - relativedelta(years=age, days=1),
+    )
+    user.hobbies.add(*hobbies)
+    return user
+
+
+class FetchSimilarUsersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chess = Hobby.objects.create(name='Chess')
+        cls.golf = Hobby.objects.create(name='Golf')
+        cls.me = make_user('me', hobbies=(cls.chess, cls.golf))
+        cls.friend = make_user('friend', hobbies=(cls.chess, cls.golf))
+        cls.pending = make_user('pending', hobbies=(cls.chess,))
+        cls.stranger = make_user('stranger', hobbies=(cls.golf,))
+        Friendship.befriend(cls.me, cls.friend)
+        Friendship.befriend(cls.friend, cls.stranger)
+        Friendship.befriend(cls.pending, cls.stranger)
+        FriendRequest.objects.create(sender=cls.pending, receiver=cls.me)
+
+    def setUp(self) -> None:
+        self.client.force_login(self.me)
+        friend_graph.reset_graph()
+        self.addCleanup(friend_graph.reset_graph)
+
+    def fetch(self, **params: Any) -> Dict[str, Any]:
+        response = self.client.get(reverse('fetch similar users api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_relationship_flags(self) -> None:
+        results = {u['username']: u for u in self.fetch()['results']}
+        self.assertEqual(set(results), {'friend', 'pending', 'stranger'})
+        self.assertEqual(results['friend']['common_hobbies'], 2)
+        self.assertTrue(results['friend']['is_friend'])
+        self.assertFalse(results['friend']['has_pending_request'])
+        self.assertTrue(results['pending']['has_pending_request'])
+        self.assertFalse(results['stranger']['is_friend'])
+        self.assertFalse(results['stranger']['has_pending_request'])
+
+    def test_mutual_friends(self) -> None:
+        expected = {'friend': 0, 'pending': 0, 'stranger': 1}
+        results = self.fetch()['results']
+        self.assertEqual({u['username']: u['mutual_friends'] for u in results}, expected)
+        friend_graph.get_graph()
+        with self.assertNumQueries(0):
+            counts = mutual_friend_counts(self.me, [u['id'] for u in results])
+        self.assertEqual({u['username']: counts[u['id']] for u in results}, expected)
+
+    def test_query_count_is_independent_of_page_size(self) -> None:
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(self.fetch(max_age=26, min_age=24)['results']), 3)
+        for i in range(10):
+            extra = make_user(f'extra{i}', hobbies=(self.chess,))
+            Friendship.befriend(extra, self.friend)
+        with CaptureQueriesContext(connection) as full:
+            self.assertEqual(len(self.fetch()['results']), 10)
+        self.assertEqual(len(small), len(full))
+
+    def test_include_common_hobbies(self) -> None:
+        with CaptureQueriesContext(connection) as plain:
+            self.fetch()
+        plain_count: int = len(plain)
+        with CaptureQueriesContext(connection) as included:
+            results = {u['username']: u for u in self.fetch(include='common_hobbies')['results']}
+        included_count: int = len(included)
+        self.assertEqual(included_count, plain_count + 1)
+        self.assertEqual(results['friend']['common_hobby_names'], ['Chess', 'Golf'])
+        self.assertEqual(results['pending']['common_hobby_names'], ['Chess'])
+        self.assertEqual(results['stranger']['common_hobby_names'], ['Golf'])
+        self.assertNotIn('common_hobby_names', self.fetch()['results'][0])
+
+        for i in range(10):
+            make_user(f'extra{i}', hobbies=(self.chess, self.golf))
+        with CaptureQueriesContext(connection) as full:
+            self.assertEqual(len(self.fetch(include='common_hobbies')['results']), 10)
+        self.assertEqual(len(full), included_count)
+        response = self.client.get(reverse('fetch similar users api'), {'include': 'common_hobbies,bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(HOBBY_INDEX_ENABLED=True)
+class HobbyIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}') for i in range(4)]
+        cls.me = make_user('me', hobbies=cls.hobbies[:3])
+        for i in range(12):
+            make_user(f'user{i}', age=20 + i, hobbies=cls.hobbies[i % 4:i % 4 + 1 + i % 3])
+        make_user('no dob', hobbies=cls.hobbies)
+        CustomUser.objects.filter(username='no dob').update(date_of_birth=None)
+
+    def setUp(self) -> None:
+        hobby_index.reset_index()
+        self.addCleanup(hobby_index.reset_index)
+
+    def ranking(self, source: str, min_age: int = 0, max_age: int = 100) -> List[Tuple[int, int]]:
+        users = get_similar_users(self.me, min_age, max_age, source)
+        return [(u.id, u.common_hobbies) for u in users[:len(users)]]
+
+    def test_index_matches_orm_ranking(self) -> None:
+        for min_age, max_age in ((0, 100), (22, 27), (30, 40)):
+            self.assertEqual(self.ranking('index', min_age, max_age), self.ranking('orm', min_age, max_age))
+        self.assertTrue(self.ranking('index'))
+
+    def test_index_follows_hobby_and_birthdate_changes(self) -> None:
+        hobby_index.get_index()
+        user = CustomUser.objects.get(username='user0')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.hobbies.add(*self.hobbies)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hobbies[1].customuser_set.remove(CustomUser.objects.get(username='user1'))
+        with self.captureOnCommitCallbacks(execute=True):
+            user2 = CustomUser.objects.get(username='user2')
+            user2.date_of_birth = date.today() - relativedelta(years=90)
+            user2.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hobbies[2].delete()
+        self.assertEqual(self.ranking('index', 20, 80), self.ranking('orm', 20, 80))
+        self.assertEqual(self.ranking('index')[0], (user.id, 2))
+
+    @override_settings(HOBBY_INDEX_ENABLED=False)
+    def test_disabled_index_falls_back_to_orm(self) -> None:
+        self.assertIsInstance(get_similar_users(self.me, 0, 100, 'index'), QuerySet)
+        self.assertIsNone(hobby_index.get_loaded_index())
+
+
+@override_settings(BITSET_ENGINE_ENABLED=True, BITSET_ENGINE_TOP_K=1000)
+class BitsetEngineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}') for i in range(10)]
+        cls.me = make_user('me', hobbies=cls.hobbies[:4])
+        for i in range(20):
+            make_user(f'user{i}', age=20 + i, hobbies=cls.hobbies[i % 7:i % 7 + 1 + i % 4])
+
+    def setUp(self) -> None:
+        bitset_engine.reset_engine()
+        self.addCleanup(bitset_engine.reset_engine)
+        self.client.force_login(self.me)
+
+    def ranking(self, source: str, score: str = 'overlap', min_age: int = 0, max_age: int = 100) -> List[tuple]:
+        users = get_similar_users(self.me, min_age, max_age, source, score)
+        return [(u.id, u.common_hobbies) for u in users[:len(users)]]
+
+    def test_overlap_matches_orm_ranking(self) -> None:
+        for min_age, max_age in ((0, 100), (22, 27), (30, 40)):
+            self.assertEqual(
+                self.ranking('bitset', min_age=min_age, max_age=max_age),
+                self.ranking('orm', min_age=min_age, max_age=max_age),
+            )
+
+    def test_normalized_scores(self) -> None:
+        mine = set(self.me.hobbies.values_list('id', flat=True))
+        expected = []
+        for user in CustomUser.objects.exclude(id=self.me.id):
+            theirs = set(user.hobbies.values_list('id', flat=True))
+            if mine & theirs:
+                expected.append((-len(mine & theirs) / len(mine | theirs), user.id))
+        users = get_similar_users(self.me, 0, 100, score='jaccard')
+        ranked = users[:len(users)]
+        self.assertEqual([u.id for u in ranked], [user_id for _, user_id in sorted(expected)])
+        for u, (score, _) in zip(ranked, sorted(expected)):
+            self.assertAlmostEqual(u.score, -score)
+
+    def test_idf_score_weighs_rare_hobbies(self) -> None:
+        import math
+
+        total: int = CustomUser.objects.count()
+        weights: Dict[int, float] = {
+            hobby.id: math.log((1 + total) / (1 + hobby.customuser_set.count())) + 1 for hobby in self.hobbies
+        }
+        mine = set(self.me.hobbies.values_list('id', flat=True))
+        expected = sorted(
+            (-sum(weights[h] for h in mine & theirs), user.id)
+            for user in CustomUser.objects.exclude(id=self.me.id)
+            if (theirs := set(user.hobbies.values_list('id', flat=True))) & mine
+        )
+        bitset_engine.get_engine()
+        with self.assertNumQueries(2):
+            users = get_similar_users(self.me, 0, 100, score='idf')
+        ranked = users[:len(users)]
+        self.assertEqual([u.id for u in ranked], [user_id for _, user_id in expected])
+        for u, (score, _) in zip(ranked, expected):
+            self.assertAlmostEqual(u.score, -score)
+        self.assertNotEqual([u.id for u in ranked], [user_id for user_id, _ in self.ranking('orm')])
+
+        # Weights are cached until BITSET_IDF_WEIGHTS_MAX_AGE passes.
+        with self.assertNumQueries(0):
+            get_similar_users(self.me, 0, 100, score='idf')
+
+    def test_top_k_breaks_ties_by_id(self) -> None:
+        full = self.ranking('orm')
+        with self.settings(BITSET_ENGINE_TOP_K=5):
+            self.assertEqual(self.ranking('bitset'), full[:5])
+
+    def test_engine_follows_hobby_changes(self) -> None:
+        bitset_engine.get_engine()
+        newcomer = make_user('newcomer', hobbies=())
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.hobbies.add(*self.hobbies[:4], Hobby.objects.create(name='Brand new'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hobbies[0].delete()
+        self.assertEqual(self.ranking('bitset'), self.ranking('orm'))
+        self.assertIn((newcomer.id, 3), self.ranking('bitset'))
+
+    def test_score_parameter(self) -> None:
+        response = self.client.get(reverse('fetch similar users api'), {'score': 'cosine'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('score', response.json()['results'][0])
+        self.assertEqual(self.client.get(reverse('fetch similar users api'), {'score': 'bogus'}).status_code, 400)
+        with self.settings(BITSET_ENGINE_ENABLED=False):
+            response = self.client.get(reverse('fetch similar users api'), {'score': 'jaccard'})
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(HOBBY_INDEX_ENABLED=True, BITSET_ENGINE_ENABLED=True)
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}') for i in range(3)]
+        cls.me = make_user('me', hobbies=cls.hobbies)
+        for i in range(25):
+            make_user(f'user{i}', hobbies=cls.hobbies[:1 + i % 3])
+
+    def setUp(self) -> None:
+        for reset in (hobby_index.reset_index, bitset_engine.reset_engine):
+            reset()
+            self.addCleanup(reset)
+        self.client.force_login(self.me)
+
+    def fetch(self, **params: Any) -> Dict[str, Any]:
+        response = self.client.get(reverse('fetch similar users api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, **params: Any) -> List[int]:
+        ids: List[int] = []
+        cursor = ''
+        while cursor is not None:
+            data = self.fetch(cursor=cursor, **params)
+            self.assertNotIn('count', data)
+            ids.extend(u['id'] for u in data['results'])
+            cursor = data['next_cursor']
+        return ids
+
+    def test_cursor_walk_matches_offset_pages(self) -> None:
+        expected: List[int] = []
+        for page in (1, 2, 3):
+            expected.extend(u['id'] for u in self.fetch(page=page, source='orm')['results'])
+        self.assertEqual(len(expected), 25)
+        for params in ({'source': 'orm'}, {'source': 'index'}, {'source': 'bitset'}):
+            self.assertEqual(self.walk(**params), expected)
+        self.assertEqual(len(self.walk(score='jaccard')), 25)
+
+    def test_with_count(self) -> None:
+        def count_queries(queries: CaptureQueriesContext) -> int:
+            return sum(q['sql'].startswith('SELECT COUNT(*)') for q in queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.fetch(cursor='', with_count='true', source='orm')['count'], 25)
+        self.assertEqual(count_queries(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.fetch(page=3, with_count='false', source='orm')
+        self.assertEqual((len(data['results']), data['has_next']), (5, False))
+        self.assertEqual(count_queries(queries), 0)
+
+    def test_invalid_cursor(self) -> None:
+        response = self.client.get(reverse('fetch similar users api'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(HOBBY_INDEX_ENABLED=True)
+    def test_non_finite_cursor(self) -> None:
+        for score in ('inf', '1e400', 'nan'):
+            for source in ('orm', 'index'):
+                cursor: str = urlsafe_b64encode(f'{score}:1'.encode()).decode()
+                response = self.client.get(reverse('fetch similar users api'), {'cursor': cursor, 'source': source})
+                self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor.'}))
+
+
+class BuildMatchesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}') for i in range(4)]
+        cls.users = [make_user(f'user{i}', age=20 + i, hobbies=cls.hobbies[i % 4:i % 4 + 1 + i % 3]) for i in range(15)]
+
+    def ranking(self, user: CustomUser, source: str, min_age: int = 0, max_age: int = 100) -> List[tuple]:
+        users = get_similar_users(user, min_age, max_age, source)
+        return [(u.id, u.common_hobbies) for u in users[:len(users)]]
+
+    def assertMatchesOrm(self) -> None:
+        for user in self.users:
+            for min_age, max_age in ((0, 100), (23, 28)):
+                self.assertEqual(
+                    self.ranking(user, 'precomputed', min_age, max_age), self.ranking(user, 'orm', min_age, max_age)
+                )
+
+    def test_full_build_matches_orm(self) -> None:
+        call_command('build_matches', stdout=StringIO())
+        self.assertMatchesOrm()
+        with self.assertNumQueries(2):
+            users = get_similar_users(self.users[0], 0, 100, 'precomputed')
+            list(users[:10])
+
+    def test_top_k_and_shards(self) -> None:
+        call_command('build_matches', top_k=2, shard_size=4, stdout=StringIO())
+        for user in self.users:
+            self.assertEqual(self.ranking(user, 'precomputed'), self.ranking(user, 'orm')[:2])
+
+    def test_incremental_build(self) -> None:
+        with self.assertRaises(CommandError):
+            call_command('build_matches', incremental=True, stdout=StringIO())
+        call_command('build_matches', stdout=StringIO())
+        self.users[0].hobbies.set(self.hobbies[2:])
+        self.users[1].hobbies.clear()
+        self.users[2].date_of_birth = date.today() - relativedelta(years=60)
+        self.users[2].save()
+        call_command('build_matches', incremental=True, stdout=StringIO())
+        self.assertMatchesOrm()
+        self.assertTrue(MatchBuild.objects.latest('started_at').incremental)
+
+
+@override_settings(MINHASH_INDEX_ENABLED=True)
+class MinHashIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}') for i in range(12)]
+        cls.users = [
+            make_user(f'user{i}', age=20 + i % 10, hobbies=cls.hobbies[i % 9:i % 9 + 1 + i % 4]) for i in range(30)
+        ]
+
+    def setUp(self) -> None:
+        minhash_index.reset_minhash_index()
+        self.addCleanup(minhash_index.reset_minhash_index)
+
+    def ranking(self, user: CustomUser, source: str) -> List[tuple]:
+        users = get_similar_users(user, 0, 100, source)
+        return [(u.id, u.common_hobbies) for u in users[:len(users)] if u.common_hobbies]
+
+    def assertApproximates(self, user: CustomUser) -> List[tuple]:
+        exact = self.ranking(user, 'orm')
+        approximate = self.ranking(user, 'minhash')
+        # Exact re-scoring: every match found has its true count, in order.
+        self.assertEqual(approximate, [row for row in exact if row in approximate])
+        # Identical hobby sets collide in every band.
+        twins = {u.id for u in self.users if u != user and set(u.hobbies.all()) == set(user.hobbies.all())}
+        self.assertLessEqual(twins, {user_id for user_id, _ in approximate})
+        return approximate
+
+    def test_build_then_serve(self) -> None:
+        call_command('build_minhash', batch_size=7, stdout=StringIO())
+        self.assertEqual(MinHashSignature.objects.count(), 30)
+        with self.assertNumQueries(2):
+            minhash_index.get_minhash_index()
+        recalled = 0
+        for user in self.users:
+            recalled += len(self.assertApproximates(user))
+        self.assertGreater(recalled, 0.8 * sum(len(self.ranking(user, 'orm')) for user in self.users))
+        with self.settings(MINHASH_MAX_CANDIDATES=2):
+            self.assertEqual(len(self.ranking(self.users[0], 'minhash')), 2)
+
+    def test_incremental_build_and_live_updates(self) -> None:
+        call_command('build_minhash', stdout=StringIO())
+        index = minhash_index.get_minhash_index()
+        newcomer = make_user('newcomer')
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.hobbies.set(self.users[4].hobbies.all())
+            self.users[4].hobbies.clear()
+        self.assertApproximates(newcomer)
+        self.assertEqual(index.candidates(self.users[4].id, 10), [])
+
+        computed_at = dict(MinHashSignature.objects.values_list('user_id', 'computed_at'))
+        call_command('build_minhash', incremental=True, stdout=StringIO())
+        rebuilt = {
+            user_id for user_id, at in MinHashSignature.objects.values_list('user_id', 'computed_at')
+            if computed_at.get(user_id) != at
+        }
+        self.assertEqual(rebuilt, {newcomer.id})
+        self.assertFalse(MinHashSignature.objects.filter(user=self.users[4]).exists())
+
+        # A fresh process loads stored signatures and computes nothing else.
+        minhash_index.reset_minhash_index()
+        self.assertApproximates(newcomer)
+
+
+@override_settings(MATCH_CACHE_ENABLED=True)
+class MatchCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chess = Hobby.objects.create(name='Chess')
+        cls.me = make_user('me', hobbies=(cls.chess,))
+        cls.other = make_user('other', hobbies=(cls.chess,))
+
+    def setUp(self) -> None:
+        caches[settings.MATCH_CACHE_ALIAS].clear()
+
+    def ranked_ids(self, min_age: int = 0, max_age: int = 100) -> List[int]:
+        users = get_similar_users(self.me, min_age, max_age)
+        return [u.id for u in users[:len(users)]]
+
+    def test_hit_skips_ranking_query(self) -> None:
+        self.assertEqual(self.ranked_ids(), [self.other.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_similar_users(self.me, 0, 100).ranking, [(self.other.id, 1)])
+        with self.assertNumQueries(1):
+            get_similar_users(self.me, 0, 30)
+
+    def test_hobby_and_birthdate_changes_invalidate(self) -> None:
+        self.assertEqual(self.ranked_ids(), [self.other.id])
+        newcomer = make_user('newcomer')
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.hobbies.add(self.chess)
+        self.assertEqual(self.ranked_ids(), [self.other.id, newcomer.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.date_of_birth = date.today() - relativedelta(years=80)
+            self.other.save()
+        self.assertEqual(self.ranked_ids(max_age=50), [newcomer.id])
+
+    def test_profile_save_without_birthdate_change_keeps_cache(self) -> None:
+        version = match_cache.get_version()
+        user = CustomUser.objects.get(pk=self.other.pk)
+        hobbies_updated_at = user.hobbies_updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            user.email = 'renamed@example.com'
+            user.save()
+        user.refresh_from_db()
+        self.assertEqual((user.hobbies_updated_at, match_cache.get_version()), (hobbies_updated_at, version))
+
+    def test_version_survives_eviction(self) -> None:
+        version = match_cache.get_version()
+        match_cache.bump_version()
+        self.assertEqual(match_cache.get_version(), version + 1)
+        caches[settings.MATCH_CACHE_ALIAS].delete(match_cache.VERSION_KEY)
+        self.assertGreater(match_cache.get_version(), version + 1)
+
+    def test_singleflight_coalesces_concurrent_calls(self) -> None:
+        flight = match_cache.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls: List[int] = []
+
+        def compute() -> int:
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 42
+
+        results: List[int] = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(calls), results), (1, [42] * 8))
+
+
+class FriendshipTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.alice = make_user('alice')
+        cls.bob = make_user('bob')
+        cls.carol = make_user('carol')
+
+    def test_accepting_a_request_stores_one_canonical_row(self) -> None:
+        request = FriendRequest.objects.create(sender=self.carol, receiver=self.alice)
+        self.client.force_login(self.alice)
+        response = self.client.post(
+            reverse('friend-request-action', args=[request.id]), {'action': 'accept'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Friendship.objects.values_list('user1_id', 'user2_id')), [(self.alice.id, self.carol.id)]
+        )
+        self.assertEqual(Friendship.befriend(self.carol, self.alice)[1], False)
+
+    def test_repeated_action_is_rejected(self) -> None:
+        request = FriendRequest.objects.create(sender=self.carol, receiver=self.alice)
+        self.client.force_login(self.alice)
+        statuses: List[int] = []
+        with mock.patch.object(events, 'publish_on_commit') as publish:
+            for action in ('accept', 'accept', 'reject'):
+                response = self.client.post(
+                    reverse('friend-request-action', args=[request.id]), {'action': action},
+                    content_type='application/json',
+                )
+                statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 400, 400])
+        self.assertEqual(response.json()['status'], 'already_handled')
+        self.assertEqual(publish.call_count, 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'accepted')
+        self.assertTrue(Friendship.objects.filter(user1=self.alice, user2=self.carol).exists())
+
+    def test_reversed_rows_are_rejected(self) -> None:
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(user1=self.bob, user2=self.alice)
+
+    def test_get_friends_is_a_single_lazy_query(self) -> None:
+        Friendship.befriend(self.alice, self.bob)
+        Friendship.befriend(self.carol, self.bob)
+        with self.assertNumQueries(0):
+            friends = self.bob.get_friends()
+        with self.assertNumQueries(1):
+            self.assertEqual(set(friends), {self.alice, self.carol})
+        self.assertEqual(list(self.alice.get_friends()), [self.bob])
+
+
+class FriendRequestBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.me = make_user('me')
+        cls.others = [make_user(f'other{i}') for i in range(6)]
+
+    def setUp(self) -> None:
+        self.client.force_login(self.me)
+
+    def post(self, name: str, payload: Dict[str, Any]) -> Any:
+        return self.client.post(reverse(name), payload, content_type='application/json')
+
+    def test_send_reports_status_per_receiver(self) -> None:
+        friend, pending, *fresh = self.others
+        Friendship.befriend(self.me, friend)
+        FriendRequest.objects.create(sender=self.me, receiver=pending)
+        receiver_ids = [u.id for u in self.others] + [self.me.id, 0, fresh[0].id]
+        response = self.post('send-friend-requests', {'receiver_ids': receiver_ids})
+        self.assertEqual(response.status_code, 200)
+        statuses = {r['receiver_id']: r['status'] for r in response.json()['results']}
+        self.assertEqual(statuses, {
+            friend.id: 'already_friends', pending.id: 'already_sent', self.me.id: 'self', 0: 'not_found',
+            **{u.id: 'sent' for u in fresh},
+        })
+        self.assertEqual(
+            set(FriendRequest.objects.filter(sender=self.me).values_list('receiver_id', flat=True)),
+            {pending.id} | {u.id for u in fresh},
+        )
+
+    def test_send_query_count_is_constant(self) -> None:
+        with CaptureQueriesContext(connection) as one:
+            self.post('send-friend-requests', {'receiver_ids': [self.others[0].id]})
+        with CaptureQueriesContext(connection) as many:
+            self.post('send-friend-requests', {'receiver_ids': [u.id for u in self.others[1:]]})
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(self.post('send-friend-requests', {'receiver_ids': 'x'}).status_code, 400)
+
+    def test_one_pending_request_per_direction(self) -> None:
+        FriendRequest.objects.create(sender=self.me, receiver=self.others[0], status='rejected')
+        FriendRequest.objects.create(sender=self.me, receiver=self.others[0])
+        FriendRequest.objects.create(sender=self.others[0], receiver=self.me)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FriendRequest.objects.create(sender=self.me, receiver=self.others[0])
+
+    def handle(self, request_ids: List[int], action: str) -> Dict[int, str]:
+        response = self.post('friend-requests-action', {'request_ids': request_ids, 'action': action})
+        self.assertEqual(response.status_code, 200)
+        return {r['request_id']: r['status'] for r in response.json()['results']}
+
+    def test_accept_and_reject_in_bulk(self) -> None:
+        requests = [FriendRequest.objects.create(sender=u, receiver=self.me) for u in self.others]
+        foreign = FriendRequest.objects.create(sender=self.others[0], receiver=self.others[1])
+        Friendship.befriend(self.me, self.others[0])
+        accept_ids = [r.id for r in requests[:4]]
+        self.assertEqual(
+            self.handle(accept_ids + [foreign.id], 'accept'),
+            {**{pk: 'accepted' for pk in accept_ids}, foreign.id: 'not_found'},
+        )
+        self.assertEqual(
+            self.handle([r.id for r in requests[3:]], 'reject'),
+            {requests[3].id: 'already_handled', requests[4].id: 'rejected', requests[5].id: 'rejected'},
+        )
+        self.assertEqual(set(self.me.get_friends()), set(self.others[:4]))
+        self.assertEqual(FriendRequest.objects.get(id=foreign.id).status, 'pending')
+
+    def test_handle_query_count_is_constant_and_updates_graph(self) -> None:
+        requests = [FriendRequest.objects.create(sender=u, receiver=self.me) for u in self.others]
+        graph = friend_graph.get_graph()
+        self.addCleanup(friend_graph.reset_graph)
+        with CaptureQueriesContext(connection) as one, self.captureOnCommitCallbacks(execute=True):
+            self.handle([requests[0].id], 'accept')
+        with CaptureQueriesContext(connection) as many, self.captureOnCommitCallbacks(execute=True):
+            self.handle([r.id for r in requests[1:]], 'accept')
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(sorted(graph.friend_ids(self.me.id).tolist()), sorted(u.id for u in self.others))
+
+
+class HobbyCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=name) for name in ('Chess', 'Golf')]
+
+    def setUp(self) -> None:
+        caches['default'].clear()
+
+    def fetch(self, **headers: str) -> Any:
+        return self.client.get(reverse('fetch hobbies api'), headers=headers)
+
+    def test_etag_and_encodings(self) -> None:
+        response = self.fetch()
+        self.assertEqual(response.json(), {'hobbies': [h.as_dict() for h in self.hobbies]})
+        etag: str = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.fetch(if_none_match=etag).status_code, 304)
+            compressed = self.fetch(accept_encoding='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), response.json())
+        self.assertNotIn('Content-Encoding', self.fetch(accept_encoding='gzip;q=0'))
+
+    def test_hobby_changes_bump_version(self) -> None:
+        etag: str = self.fetch()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Hobby.objects.create(name='Go')
+        response = self.fetch(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([h['name'] for h in response.json()['hobbies']], ['Chess', 'Golf', 'Go'])
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hobbies[0].delete()
+        self.assertEqual(len(self.fetch(if_none_match=etag).json()['hobbies']), 2)
+
+
+class AddHobbiesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.me = make_user('me')
+        Hobby.objects.create(name='Chess')
+
+    def add(self, names: str) -> Any:
+        return self.client.put(
+            reverse('update hobbies api'), {'action': 'add', 'hobby': names}, content_type='application/json'
+        )
+
+    def test_query_count_is_independent_of_names(self) -> None:
+        self.client.force_login(self.me)
+        with mock.patch.object(CustomUser, 'save') as save:
+            with CaptureQueriesContext(connection) as few:
+                self.add('Chess, Golf')
+            with CaptureQueriesContext(connection) as many:
+                self.add(', '.join(f'Hobby {i}' for i in range(20)) + ', Chess, Golf, Hobby 3')
+        save.assert_not_called()
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(self.me.hobbies.count(), 22)
+        self.assertEqual(Hobby.objects.count(), 22)
+        self.assertEqual(self.add(' , ').status_code, 400)
+
+    def test_forms_use_the_same_helper(self) -> None:
+        from .forms import CustomUserCreationForm
+
+        form = CustomUserCreationForm(data={
+            'username': 'new', 'email': 'new@example.com', 'password1': 'Str0ng-passw0rd!',
+            'password2': 'Str0ng-passw0rd!', 'hobbies': 'Chess, Golf,, Golf',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        user = form.save()
+        self.assertEqual(sorted(user.hobbies.values_list('name', flat=True)), ['Chess', 'Golf'])
+
+    def test_new_hobbies_reach_catalog_and_search_index(self) -> None:
+        self.client.force_login(self.me)
+        etag: str = self.client.get(reverse('fetch hobbies api'))['ETag']
+        index = hobby_search.get_search_index()
+        self.addCleanup(hobby_search.reset_search_index)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add('Golf')
+        self.assertNotEqual(self.client.get(reverse('fetch hobbies api'))['ETag'], etag)
+        self.assertEqual([h['name'] for h in index.search('go', 10)], ['Golf'])
+
+    def test_names_match_ignoring_case_and_whitespace(self) -> None:
+        self.client.force_login(self.me)
+        self.assertEqual(self.add('chess ,  Rock   climbing, ROCK CLIMBING').status_code, 200)
+        self.assertEqual(sorted(self.me.hobbies.values_list('name', flat=True)), ['Chess', 'Rock climbing'])
+        self.assertEqual(Hobby.objects.count(), 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Hobby.objects.create(name='CHESS')
+
+
+class MergeHobbiesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chess = Hobby.objects.create(name='Chess')
+        cls.golf = Hobby.objects.create(name='Golf')
+        # Rows written before names were normalized; update() skips save().
+        cls.duplicates = [Hobby.objects.create(name=f'dup {i}') for i in range(2)]
+        Hobby.objects.filter(id=cls.duplicates[0].id).update(name='chess ')
+        Hobby.objects.filter(id=cls.duplicates[1].id).update(name=' CHESS')
+        cls.both = make_user('both', hobbies=[cls.chess, cls.duplicates[0]])
+        cls.users = [make_user(f'user{i}', hobbies=[cls.duplicates[i % 2], cls.golf]) for i in range(5)]
+
+    def test_merges_in_batches_into_the_oldest_hobby(self) -> None:
+        call_command('merge_hobbies', dry_run=True, stdout=StringIO())
+        self.assertEqual(Hobby.objects.count(), 4)
+
+        before: Dict[int, Any] = dict(CustomUser.objects.values_list('id', 'hobbies_updated_at'))
+        call_command('merge_hobbies', batch_size=2, stdout=StringIO())
+        self.assertEqual(sorted(Hobby.objects.values_list('name', flat=True)), ['Chess', 'Golf'])
+        for user in [self.both, *self.users]:
+            self.assertEqual(list(user.hobbies.filter(name='Chess')), [self.chess])
+            user.refresh_from_db()
+            self.assertNotEqual(user.hobbies_updated_at, before[user.id])
+        self.assertEqual(
+            set(Tombstone.objects.filter(kind=Tombstone.KIND_HOBBY).values_list('object_id', flat=True)),
+            {hobby.id for hobby in self.duplicates},
+        )
+
+    def test_renamed_hobbies_reach_sync_catalog_and_search(self) -> None:
+        past = timezone.now() - timedelta(minutes=10)
+        Hobby.objects.filter(id=self.golf.id).update(name='  Golf   links', updated_at=past)
+        index = hobby_search.get_search_index()
+        self.addCleanup(hobby_search.reset_search_index)
+        self.client.force_login(self.both)
+        etag: str = self.client.get(reverse('fetch hobbies api'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('merge_hobbies', stdout=StringIO())
+        data = self.client.get(reverse('sync api'), {'since': encode_sync_token(past + timedelta(minutes=1))}).json()
+        self.assertIn('Golf links', [h['name'] for h in data['hobbies']['updated']])
+        self.assertNotEqual(self.client.get(reverse('fetch hobbies api'))['ETag'], etag)
+        self.assertEqual([h['name'] for h in index.search('golf', 10)], ['Golf links'])
+
+
+class HobbyPopularityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chess, cls.golf, cls.go = (Hobby.objects.create(name=name) for name in ('Chess', 'Golf', 'Go'))
+        cls.users = [make_user(f'user{i}', hobbies=[cls.chess]) for i in range(3)]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(Hobby.objects.values_list('name', 'user_count'))
+
+    def test_counts_follow_membership_changes(self) -> None:
+        first, second, third = self.users
+        self.assertEqual(self.counts(), {'Chess': 3, 'Golf': 0, 'Go': 0})
+        first.hobbies.add(self.chess, self.golf)
+        first.hobbies.remove(self.go)
+        second.hobbies.set([self.golf, self.go])
+        self.assertEqual(self.counts(), {'Chess': 2, 'Golf': 2, 'Go': 1})
+        self.go.customuser_set.add(first, second)
+        self.golf.customuser_set.remove(first, third)
+        self.assertEqual(self.counts(), {'Chess': 2, 'Golf': 1, 'Go': 2})
+        first.hobbies.clear()
+        third.delete()
+        self.assertEqual(self.counts(), {'Chess': 0, 'Golf': 1, 'Go': 1})
+        self.go.customuser_set.clear()
+        self.assertEqual(self.counts(), {'Chess': 0, 'Golf': 1, 'Go': 0})
+
+    def test_reconcile_fixes_drift(self) -> None:
+        Hobby.objects.update(user_count=7)
+        out = StringIO()
+        call_command('reconcile_hobby_counts', stdout=out)
+        self.assertIn('Corrected 3', out.getvalue())
+        self.assertEqual(self.counts(), {'Chess': 3, 'Golf': 0, 'Go': 0})
+
+    def test_popular_endpoint(self) -> None:
+        self.users[0].hobbies.add(self.go)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('popular hobbies api'), {'limit': 2})
+        self.assertEqual(
+            response.json()['hobbies'],
+            [{'id': self.chess.id, 'name': 'Chess', 'user_count': 3}, {'id': self.go.id, 'name': 'Go', 'user_count': 1}],
+        )
+        self.assertEqual(self.client.get(reverse('popular hobbies api'), {'limit': 'x'}).status_code, 400)
+
+
+class HobbySearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for name in ('Chess', 'chess boxing', 'Cheese making', 'Climbing', 'Go'):
+            Hobby.objects.create(name=name)
+
+    def setUp(self) -> None:
+        hobby_search.reset_search_index()
+        self.addCleanup(hobby_search.reset_search_index)
+
+    def search(self, q: str, limit: int = 10) -> List[str]:
+        response = self.client.get(reverse('search hobbies api'), {'q': q, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return [h['name'] for h in response.json()['hobbies']]
+
+    def test_database_and_index_agree(self) -> None:
+        queries = ('', 'ch', 'CHESS ', 'chess  B', 'che', 'c', 'x')
+        from_database = {q: self.search(q) for q in queries}
+        self.assertEqual(from_database['ch'], ['Cheese making', 'Chess', 'chess boxing'])
+        self.assertEqual(from_database['chess  B'], ['chess boxing'])
+        self.assertEqual(self.search('c', limit=2), ['Cheese making', 'Chess'])
+        with override_settings(HOBBY_SEARCH_INDEX_ENABLED=True):
+            self.assertEqual({q: self.search(q) for q in queries}, from_database)
+
+    @override_settings(HOBBY_SEARCH_INDEX_ENABLED=True)
+    def test_index_follows_hobby_changes(self) -> None:
+        index = hobby_search.get_search_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Hobby.objects.create(name='Checkers')
+            climbing = Hobby.objects.get(name='Climbing')
+            climbing.name = 'Chalk art'
+            climbing.save()
+            Hobby.objects.get(name='Go').delete()
+        self.assertEqual(self.search('ch'), ['Chalk art', 'Checkers', 'Cheese making', 'Chess', 'chess boxing'])
+        self.assertEqual(self.search('g'), [])
+        with self.assertNumQueries(0):
+            index.search('c', 10)
+
+
+class FetchFriendRequestsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.me = make_user('me')
+        cls.requests = [
+            FriendRequest.objects.create(sender=make_user(f'sender{i}'), receiver=cls.me) for i in range(7)
+        ]
+        # Equal timestamps are ordered by id.
+        FriendRequest.objects.filter(id__in=[r.id for r in cls.requests[2:5]]).update(
+            timestamp=cls.requests[2].timestamp
+        )
+        cls.requests[6].status = 'accepted'
+        cls.requests[6].save()
+
+    def setUp(self) -> None:
+        self.client.force_login(self.me)
+
+    def fetch(self, **params: Any) -> Dict[str, Any]:
+        response = self.client.get(reverse('friend-requests'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pages_in_constant_queries(self) -> None:
+        ids: List[int] = []
+        senders: List[str] = []
+        cursor = ''
+        while cursor is not None:
+            with self.assertNumQueries(3):  # session, user, page
+                data = self.fetch(limit=2, cursor=cursor)
+            ids.extend(r['id'] for r in data['friend_requests'])
+            senders.extend(r['sender'] for r in data['friend_requests'])
+            cursor = data['next_cursor']
+        expected = sorted(self.requests[:6], key=lambda r: (r.timestamp, r.id), reverse=True)
+        self.assertEqual(ids, [r.id for r in expected])
+        self.assertEqual(senders, [r.sender.username for r in expected])
+
+    def test_count_only(self) -> None:
+        self.assertEqual(self.fetch(count_only=1), {'count': 6})
+        self.assertEqual(self.client.get(reverse('friend-requests'), {'cursor': 'x'}).status_code, 400)
+
+
+class FriendRequestEventsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.me = make_user('me')
+        cls.others = [make_user(f'other{i}') for i in range(3)]
+
+    def setUp(self) -> None:
+        events.reset_broker()
+        self.addCleanup(events.reset_broker)
+
+    def published(self, fn: Any) -> List[Tuple[str, str, int]]:
+        with mock.patch.object(events.InMemoryBroker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                fn()
+        return sorted((channel, event['type'], event['id']) for (channel, event), _ in publish.call_args_list)
+
+    def test_save_paths_publish_events(self) -> None:
+        self.client.force_login(self.others[0])
+        post = lambda name, payload: self.client.post(reverse(name), payload, content_type='application/json')
+        request = FriendRequest.objects.create(sender=self.others[1], receiver=self.me)
+        self.assertEqual(
+            self.published(lambda: post('send-friend-request', {'receiver_id': self.me.id})),
+            [(f'user:{self.me.id}', 'created', request.id + 1)],
+        )
+        self.assertEqual(
+            self.published(lambda: post('send-friend-requests', {'receiver_ids': [self.others[2].id]})),
+            [(f'user:{self.others[2].id}', 'created', request.id + 2)],
+        )
+        self.client.force_login(self.me)
+        reject = lambda: self.client.post(
+            reverse('friend-request-action', args=[request.id]), {'action': 'reject'}, content_type='application/json'
+        )
+        self.assertEqual(
+            self.published(reject),
+            sorted([(f'user:{self.me.id}', 'rejected', request.id), (f'user:{self.others[1].id}', 'rejected', request.id)]),
+        )
+        self.assertEqual(
+            self.published(lambda: post('friend-requests-action', {'request_ids': [request.id + 1], 'action': 'accept'})),
+            sorted([(f'user:{self.me.id}', 'accepted', request.id + 1),
+                    (f'user:{self.others[0].id}', 'accepted', request.id + 1)]),
+        )
+
+    async def test_stream_delivers_published_events(self) -> None:
+        await self.async_client.aforce_login(self.me)
+        response = await self.async_client.get(reverse('friend-request-events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+        events.get_broker().publish(f'user:{self.others[0].id}', {'type': 'created', 'id': 1})
+        events.get_broker().publish(f'user:{self.me.id}', {'type': 'created', 'id': 2})
+        self.assertEqual(
+            await anext(chunks), b'event: friend_request\ndata: {"type": "created", "id": 2}\n\n'
+        )
+        with override_settings(FRIEND_EVENTS_HEARTBEAT=0.01):
+            self.assertEqual(await anext(chunks), b': keep-alive\n\n')
+        # The ASGI handler cancels the response task when the client disconnects.
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertFalse(events.get_broker()._subscriptions)
+
+
+class SyncApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobby = Hobby.objects.create(name='Chess')
+        cls.me = make_user('me')
+        cls.friend = make_user('friend')
+        cls.other = make_user('other')
+        Friendship.befriend(cls.me, cls.friend)
+        cls.request = FriendRequest.objects.create(sender=cls.other, receiver=cls.me)
+
+    def setUp(self) -> None:
+        self.client.force_login(self.me)
+
+    def sync(self, token: str = '') -> Dict[str, Any]:
+        response = self.client.get(reverse('sync api'), {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_then_delta(self) -> None:
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual([h['name'] for h in data['hobbies']['updated']], ['Chess'])
+        self.assertEqual([r['id'] for r in data['friend_requests']['updated']], [self.request.id])
+        self.assertEqual([f['username'] for f in data['friends']['updated']], ['friend'])
+
+        past = timezone.now() - timedelta(minutes=10)
+        for model in (Hobby, FriendRequest, Friendship, CustomUser):
+            model.objects.update(updated_at=past)
+        token = encode_sync_token(past + timedelta(minutes=1))
+        data = self.sync(token)
+        self.assertFalse(data['full'])
+        self.assertEqual(
+            [data[key] for key in ('hobbies', 'friend_requests', 'friends')], [{'updated': [], 'deleted': []}] * 3
+        )
+
+        golf = Hobby.objects.create(name='Golf')
+        chess_id: int = self.hobby.id
+        self.hobby.delete()
+        self.client.post(
+            reverse('friend-request-action', args=[self.request.id]), {'action': 'accept'},
+            content_type='application/json',
+        )
+        Friendship.objects.filter(user2=self.friend).delete()
+        data = self.sync(token)
+        self.assertEqual(data['hobbies'], {'updated': [golf.as_dict()], 'deleted': [chess_id]})
+        self.assertEqual(
+            [(r['id'], r['status']) for r in data['friend_requests']['updated']], [(self.request.id, 'accepted')]
+        )
+        self.assertEqual(data['friends'], {
+            'updated': [{'id': self.other.id, 'username': 'other', 'email': 'other@example.com'}],
+            'deleted': [self.friend.id],
+        })
+
+    def test_profile_edits_reach_deltas(self) -> None:
+        past = timezone.now() - timedelta(minutes=10)
+        for model in (Hobby, FriendRequest, Friendship, CustomUser):
+            model.objects.update(updated_at=past)
+        token = encode_sync_token(past + timedelta(minutes=1))
+
+        self.me.email = 'me@example.org'
+        self.me.save()
+        data = self.sync(token)
+        self.assertEqual([data['friends']['updated'], data['friend_requests']['updated']], [[], []])
+
+        for user, username in ((self.friend, 'renamed friend'), (self.other, 'renamed other')):
+            user.username = username
+            user.save()
+        data = self.sync(token)
+        self.assertEqual([f['username'] for f in data['friends']['updated']], ['renamed friend'])
+        self.assertEqual([r['sender'] for r in data['friend_requests']['updated']], ['renamed other'])
+
+    def test_stale_or_invalid_token(self) -> None:
+        self.assertTrue(self.sync(encode_sync_token(timezone.now() - timedelta(days=365)))['full'])
+        self.assertEqual(self.client.get(reverse('sync api'), {'since': '!'}).status_code, 400)
+        Tombstone.objects.create(kind=Tombstone.KIND_HOBBY, object_id=1)
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=365))
+        call_command('purge_tombstones', stdout=StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class UserSerializationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.hobbies = [Hobby.objects.create(name=f'Hobby {i}', description=f'About {i}') for i in range(3)]
+        cls.users = [make_user(f'user{i}', hobbies=cls.hobbies[:i + 1]) for i in range(4)]
+        for friend in cls.users[1:]:
+            Friendship.befriend(friend, cls.users[0])
+        Friendship.befriend(cls.users[2], cls.users[3])
+
+    def test_as_dict(self) -> None:
+        user = self.users[2]
+        with self.assertNumQueries(2):
+            data = user.as_dict()
+        self.assertEqual(data['hobbies'], [h.as_dict() for h in self.hobbies])
+        self.assertEqual(
+            data['friends'],
+            [{'id': u.id, 'username': u.username, 'email': u.email} for u in (self.users[0], self.users[3])],
+        )
+
+    def test_as_dicts_query_count_is_constant(self) -> None:
+        with self.assertNumQueries(2):
+            data = CustomUser.as_dicts(self.users)
+        self.assertEqual([len(d['friends']) for d in data], [3, 1, 2, 2])
+        self.assertEqual([len(d['hobbies']) for d in data], [1, 2, 3, 3])
+        users = list(CustomUser.objects.prefetch_related('hobbies').filter(id__in=[u.id for u in self.users]))
+        with self.assertNumQueries(1):
+            self.assertEqual(CustomUser.as_dicts(users), data)
+
+    def test_user_api(self) -> None:
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('user api'))
+        self.assertEqual(response.json(), self.users[0].as_dict())
+
+
+class FriendsApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.me = make_user('me')
+        cls.friends = [make_user(name) for name in ('anna', 'Andy', 'bella', 'carl', 'cathy')]
+        for friend in cls.friends:
+            Friendship.befriend(cls.me, friend)
+        make_user('ann_stranger')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.me)
+
+    def fetch(self, **params: Any) -> Dict[str, Any]:
+        response = self.client.get(reverse('friends api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pages(self) -> None:
+        usernames: List[str] = []
+        cursor = ''
+        while cursor is not None:
+            data = self.fetch(limit=2, cursor=cursor)
+            self.assertLessEqual(len(data['friends']), 2)
+            usernames.extend(f['username'] for f in data['friends'])
+            cursor = data['next_cursor']
+        self.assertEqual(usernames, sorted(f.username for f in self.friends))
+
+    def test_prefix_filter(self) -> None:
+        self.assertEqual({f['username'] for f in self.fetch(q='an')['friends']}, {'anna', 'Andy'})
+        self.assertEqual(self.client.get(reverse('friends api'), {'limit': 'x'}).status_code, 400)
+
+    def test_user_api_summary(self) -> None:
+        data = self.client.get(reverse('user api'), {'summary': '1'}).json()
+        self.assertNotIn('friends', data)
+        self.assertEqual(data['friend_count'], 5)
+        data = self.client.get(reverse('user api'), {'fields': 'id,friend_count'}).json()
+        self.assertEqual(data, {'id': self.me.id, 'friend_count': 5})
+
+
+class FriendGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chess = Hobby.objects.create(name='Chess')
+        cls.users = [make_user(f'user{i}') for i in range(12)]
+        for a, b in ((0, 1), (0, 2), (0, 3), (1, 4), (2, 4), (3, 4), (1, 5), (2, 6), (3, 7), (7, 8), (9, 10)):
+            Friendship.befriend(cls.users[a], cls.users[b])
+
+    def setUp(self) -> None:
+        friend_graph.reset_graph()
+        self.addCleanup(friend_graph.reset_graph)
+
+    def expected(self, user: CustomUser) -> List[Tuple[int, int]]:
+        friends = set(user.get_friends().values_list('id', flat=True))
+        counts: Dict[int, int] = {}
+        for friend in CustomUser.objects.filter(id__in=friends):
+            for other in friend.get_friends().values_list('id', flat=True):
+                if other != user.id and other not in friends:
+                    counts[other] = counts.get(other, 0) + 1
+        return sorted(counts.items(), key=lambda row: (-row[1], row[0]))
+
+    def test_suggestions_match_brute_force(self) -> None:
+        graph = friend_graph.get_graph()
+        for user in self.users:
+            self.assertEqual(graph.suggest(user.id, 100), self.expected(user))
+        self.assertEqual(graph.suggest(self.users[0].id, 100)[0], (self.users[4].id, 3))
+        self.assertEqual(graph.suggest(self.users[4].id, 2), self.expected(self.users[4])[:2])
+
+    def test_incremental_inserts_and_compaction(self) -> None:
+        graph = friend_graph.get_graph()
+        newcomer = make_user('newcomer')
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.befriend(self.users[4], newcomer)
+            Friendship.befriend(self.users[11], newcomer)
+        for user in self.users + [newcomer]:
+            self.assertEqual(graph.suggest(user.id, 100), self.expected(user))
+        with mock.patch.object(friend_graph, 'COMPACT_THRESHOLD', 1), self.captureOnCommitCallbacks(execute=True):
+            Friendship.befriend(self.users[9], newcomer)
+        self.assertFalse(graph._added)
+        # Re-adding known edges, in the CSR arrays or not, changes nothing.
+        graph.add_edges(Friendship.objects.values_list('user1_id', 'user2_id')[:5])
+        for user in self.users + [newcomer]:
+            self.assertEqual(graph.suggest(user.id, 100), self.expected(user))
+
+    def test_deletion_reloads_graph(self) -> None:
+        graph = friend_graph.get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(user1=self.users[0], user2=self.users[1]).delete()
+        self.assertTrue(graph.stale)
+        self.assertEqual(friend_graph.get_graph().suggest(self.users[0].id, 100), self.expected(self.users[0]))
+
+    def test_suggestions_endpoint(self) -> None:
+        self.users[0].hobbies.add(self.chess)
+        self.users[6].hobbies.add(self.chess)
+        self.client.force_login(self.users[0])
+        results = self.client.get(reverse('fetch friend suggestions api'), {'limit': 2}).json()['results']
+        self.assertEqual([(r['username'], r['mutual_friends']) for r in results], [('user4', 3), ('user5', 1)])
+        results = self.client.get(
+            reverse('fetch friend suggestions api'), {'limit': 2, 'hobby_weight': 5}
+        ).json()['results']
+        self.assertEqual([(r['username'], r['score']) for r in results], [('user6', 6), ('user4', 3)])
+        # Shared hobbies count whatever the candidate's age, even without one.
+        CustomUser.objects.filter(id=self.users[5].id).update(date_of_birth=None)
+        self.users[5].hobbies.add(self.chess)
+        results = self.client.get(
+            reverse('fetch friend suggestions api'), {'limit': 3, 'hobby_weight': 5}
+        ).json()['results']
+        self.assertEqual(
+            [(r['username'], r['common_hobbies'], r['score']) for r in results],
+            [('user5', 1, 6), ('user6', 1, 6), ('user4', 0, 3)],
+        )
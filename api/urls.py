@@ -34,14 +34,22 @@ urlpatterns: List[URLPattern] = [
     path('login/', auth_views.LoginView.as_view(template_name='api/login.html'), name='login'),
     path('logout/', logout_view, name='logout'),
     path('user/', user_api, name='user api'),
+    path('friends/', friends_api, name='friends api'),
+    path('sync/', sync_api, name='sync api'),
     path('update-profile/', update_profile_api, name='update profile api'),
     path('change-password/', change_password_api, name='change password api'),
     path('update-hobbies/', update_hobbies_api, name='update hobbies api'),
     path('fetch-hobbies/', fetch_hobbies_api, name='fetch hobbies api'),
+    path('hobbies/search/', search_hobbies_api, name='search hobbies api'),
+    path('hobbies/popular/', popular_hobbies_api, name='popular hobbies api'),
     path('fetch-similar-users/', fetch_similar_users_api, name='fetch similar users api'),
+    path('fetch-friend-suggestions/', fetch_friend_suggestions_api, name='fetch friend suggestions api'),
     path('register/', SignUpView.as_view(), name='register'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('send-friend-request/', send_friend_request_api, name='send-friend-request'),
+    path('send-friend-requests/', send_friend_requests_api, name='send-friend-requests'),
     path('fetch-friend-requests/', fetch_friend_requests_api, name='friend-requests'),
+    path('friend-request-events/', friend_request_events_api, name='friend-request-events'),
     path('handle-friend-request/<int:pk>/', handle_friend_request_api, name='friend-request-action'),
+    path('handle-friend-requests/', handle_friend_requests_api, name='friend-requests-action'),
 ]
@@ -1,15 +1,126 @@
-from typing import List, Dict
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
+from typing import Any, List, Dict, Optional, Tuple, Union
 from dateutil.relativedelta import relativedelta
-from django.db.models import QuerySet, Count, Q
-from datetime import date
+from django.conf import settings
+from django.db.models import BooleanField, QuerySet, Count, Exists, ExpressionWrapper, OuterRef, Q
+from django.db.models.functions import Lower
+from datetime import date, datetime, timezone as dt_timezone
 
-from api.models import CustomUser
+from api import bitset_engine, friend_graph, hobby_index, match_cache, minhash_index
+from api.models import CustomUser, FriendRequest, Friendship, Hobby, SimilarUserMatch
+from api.signals import hobbies_created
 
 
-def filter_users_by_age(user: CustomUser, min_age: int, max_age: int) -> QuerySet[CustomUser]:
+class RankedUsers:
     """
-    Return all users (excluding current user) whose age is in [min_age, max_age].
-    
+    A precomputed ranking of ``(user_id, common_hobbies)`` pairs that can be
+    handed to ``Paginator`` in place of a queryset.
+
+    Slicing hydrates only the requested rows, with one ``id__in`` query
+    against ``queryset``, and sets ``common_hobbies`` (and ``score``, when the
+    ranking has separate scores) on each user.
+    """
+
+    def __init__(
+        self,
+        ranking: List[Tuple[int, int]],
+        queryset: Optional[QuerySet[CustomUser]] = None,
+        scores: Optional[List[float]] = None,
+    ) -> None:
+        self.ranking = ranking
+        self.queryset = queryset if queryset is not None else CustomUser.objects.all()
+        self.scores = scores
+
+    def using(self, queryset: QuerySet[CustomUser]) -> 'RankedUsers':
+        """
+        Return the same ranking hydrated from ``queryset`` (e.g. an annotated one).
+        """
+        return RankedUsers(self.ranking, queryset, self.scores)
+
+    def count(self) -> int:
+        return len(self.ranking)
+
+    def key_at(self, position: int) -> Tuple[float, int]:
+        """
+        Return the ``(score, user_id)`` sort key of the row at ``position``.
+        """
+        user_id, common_hobbies = self.ranking[position]
+        return (self.scores[position] if self.scores is not None else common_hobbies), user_id
+
+    def position_after(self, score: float, user_id: int) -> int:
+        """
+        Return the position of the first row ranked after ``(score, user_id)``.
+        """
+        def sort_key(position: int) -> Tuple[float, int]:
+            row_score, row_id = self.key_at(position)
+            return -row_score, row_id
+
+        return bisect_right(range(len(self.ranking)), (-score, user_id), key=sort_key)
+
+    def __len__(self) -> int:
+        return len(self.ranking)
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, int):
+            return self[key:key + 1][0]
+        rows: List[Tuple[int, int]] = self.ranking[key]
+        scores: List[float] = self.scores[key] if self.scores is not None else []
+        users: Dict[int, CustomUser] = self.queryset.in_bulk([user_id for user_id, _ in rows])
+        page: List[CustomUser] = []
+        for i, (user_id, common_hobbies) in enumerate(rows):
+            # Users deleted since the ranking was computed are skipped.
+            if user_id in users:
+                users[user_id].common_hobbies = common_hobbies
+                if scores:
+                    users[user_id].score = scores[i]
+                page.append(users[user_id])
+        return page
+
+
+def add_hobbies(user: CustomUser, names: List[str]) -> List[Hobby]:
+    """
+    Attach the hobbies called ``names`` to ``user``, creating missing ones.
+    Names are matched ignoring case and extra whitespace, so "chess " finds
+    an existing "Chess".
+
+    Costs a constant number of queries however many names there are: one
+    lookup, one ``bulk_create`` for the missing names (plus one lookup of
+    their ids) and a single ``add``. The user row is not saved.
+    """
+    spellings: Dict[str, str] = {}
+    for name in names:
+        if name.strip():
+            spellings.setdefault(Hobby.name_key(name), Hobby.normalize_name(name))
+    names = list(spellings.values())
+    if not names:
+        return []
+
+    def lookup(names: List[str]) -> Dict[str, Hobby]:
+        # The exact-name branch covers databases whose LOWER only folds ASCII.
+        hobbies = Hobby.objects.annotate(name_lower=Lower('name')).filter(
+            Q(name_lower__in=[Hobby.name_key(name) for name in names]) | Q(name__in=names)
+        )
+        return {Hobby.name_key(hobby.name): hobby for hobby in hobbies}
+
+    hobbies: Dict[str, Hobby] = lookup(names)
+    missing: List[str] = [name for name in names if Hobby.name_key(name) not in hobbies]
+    if missing:
+        # ignore_conflicts tolerates concurrent inserts of the same name but
+        # leaves primary keys unset, so the new rows are read back.
+        Hobby.objects.bulk_create([Hobby(name=name) for name in missing], ignore_conflicts=True)
+        created: Dict[str, Hobby] = lookup(missing)
+        hobbies.update(created)
+        hobbies_created(list(created.values()))
+    user.hobbies.add(*(hobby.id for hobby in hobbies.values()))
+    return [hobbies[Hobby.name_key(name)] for name in names]
+
+
+def birthdate_range(min_age: int, max_age: int) -> Tuple[date, date]:
+    """
+    Return the (earliest, latest) birthdates of users aged [min_age, max_age].
+
     If min_age=10 and max_age=20, we want DOB between:
       [today - 20 years, today - 10 years].
     """
@@ -21,6 +132,15 @@ def filter_users_by_age(user: CustomUser, min_age: int, max_age: int) -> QuerySe
     # Latest birthdate for a user to still be within min_age
     latest_birthdate: date = today - relativedelta(years=min_age)
 
+    return earliest_birthdate, latest_birthdate
+
+
+def filter_users_by_age(user: CustomUser, min_age: int, max_age: int) -> QuerySet[CustomUser]:
+    """
+    Return all users (excluding current user) whose age is in [min_age, max_age].
+    """
+    earliest_birthdate, latest_birthdate = birthdate_range(min_age, max_age)
+
     return (
         CustomUser.objects
                   .filter(
@@ -35,7 +155,8 @@ def filter_users_by_age(user: CustomUser, min_age: int, max_age: int) -> QuerySe
 def get_filtered_and_sorted_users(user: CustomUser, min_age: int, max_age: int) -> QuerySet[CustomUser]:
     """
     Filter users by [min_age, max_age], then annotate each user
-    with the count of hobbies in common, sorting descending by that count.
+    with the count of hobbies in common, sorting descending by that count
+    (ties broken by id, so pages are stable).
     """
     filtered_users: QuerySet[CustomUser] = filter_users_by_age(user, min_age, max_age)
     return filtered_users.annotate(
@@ -44,7 +165,270 @@ def get_filtered_and_sorted_users(user: CustomUser, min_age: int, max_age: int)
             filter=Q(hobbies__in=user.hobbies.all()),
             distinct=True
         )
-    ).order_by('-common_hobbies')
+    ).order_by('-common_hobbies', 'id')
+
+
+def get_similar_users(
+    user: CustomUser, min_age: int, max_age: int, source: Optional[str] = None, score: str = 'overlap'
+) -> Union[QuerySet[CustomUser], RankedUsers]:
+    """
+    Rank users similar to ``user`` from the requested ``source``.
+
+    ``'index'`` serves from the in-process hobby index when
+    ``HOBBY_INDEX_ENABLED`` is set, ``'bitset'`` from the bit-matrix engine
+    when ``BITSET_ENGINE_ENABLED`` is set, and ``'precomputed'`` from the
+    table written by ``manage.py build_matches``; anything else, or a
+    disabled backend, falls back to the ORM aggregate of
+    ``get_filtered_and_sorted_users``. All paths return the same overlap
+    ranking, though the bitset engine stops at ``BITSET_ENGINE_TOP_K`` rows
+    and the precomputed one at each user's ``MATCHES_TOP_K`` (as of the last
+    build).
+
+    ``'minhash'`` (with ``MINHASH_INDEX_ENABLED``) is approximate: it
+    re-scores exactly only the ``MINHASH_MAX_CANDIDATES`` users found in the
+    requester's LSH buckets, so weak matches may be missing.
+
+    Scores other than ``'overlap'`` are only computed by the bitset engine;
+    a ValueError is raised if it is disabled or the score is unknown.
+
+    With ``MATCH_CACHE_ENABLED`` the ranking is cached per user, age range,
+    source and score, and always returned as ``RankedUsers``.
+    """
+    if score != 'overlap':
+        if score not in bitset_engine.SCORES:
+            raise ValueError(f'Unknown score "{score}".')
+        if not settings.BITSET_ENGINE_ENABLED:
+            raise ValueError(f'The "{score}" score is not enabled.')
+        source = 'bitset'
+    if source is None:
+        source = 'index' if settings.HOBBY_INDEX_ENABLED else 'orm'
+    if settings.MATCH_CACHE_ENABLED:
+        def compute() -> Tuple[List[Tuple[int, int]], Optional[List[float]]]:
+            users = _rank_similar_users(user, min_age, max_age, source, score)
+            if isinstance(users, RankedUsers):
+                return users.ranking, users.scores
+            return list(users.values_list('id', 'common_hobbies')), None
+
+        ranking, scores = match_cache.get_or_compute(f'{user.id}:{min_age}:{max_age}:{source}:{score}', compute)
+        return RankedUsers(ranking, scores=scores)
+    return _rank_similar_users(user, min_age, max_age, source, score)
+
+
+def _rank_similar_users(
+    user: CustomUser, min_age: int, max_age: int, source: str, score: str
+) -> Union[QuerySet[CustomUser], RankedUsers]:
+    earliest_birthdate, latest_birthdate = birthdate_range(min_age, max_age)
+    if source == 'bitset' and settings.BITSET_ENGINE_ENABLED:
+        engine: bitset_engine.BitsetEngine = bitset_engine.get_engine()
+        if score == 'idf':
+            engine.refresh_weights(max_age=settings.BITSET_IDF_WEIGHTS_MAX_AGE)
+        ids, common, scores = engine.rank(
+            user.id, earliest_birthdate, latest_birthdate, score, settings.BITSET_ENGINE_TOP_K
+        )
+        return RankedUsers(list(zip(ids.tolist(), common.tolist())), scores=scores.tolist())
+    if source == 'precomputed':
+        matches = SimilarUserMatch.objects.filter(
+            user=user, candidate_dob__range=(earliest_birthdate, latest_birthdate)
+        ).order_by('-common_hobbies', 'candidate_id')
+        return RankedUsers(list(matches.values_list('candidate_id', 'common_hobbies')))
+    if source == 'index' and settings.HOBBY_INDEX_ENABLED:
+        return RankedUsers(hobby_index.get_index().rank(user.id, earliest_birthdate, latest_birthdate))
+    if source == 'minhash' and settings.MINHASH_INDEX_ENABLED:
+        candidates: List[int] = minhash_index.get_minhash_index().candidates(
+            user.id, settings.MINHASH_MAX_CANDIDATES
+        )
+        return RankedUsers(rank_candidates(user.id, candidates, earliest_birthdate, latest_birthdate))
+    return get_filtered_and_sorted_users(user, min_age, max_age)
+
+
+def rank_candidates(
+    user_id: int, candidate_ids: List[int], earliest_birthdate: date, latest_birthdate: date
+) -> List[Tuple[int, int]]:
+    """
+    Return ``(user_id, common_hobbies)`` for the ``candidate_ids`` born in
+    ``[earliest_birthdate, latest_birthdate]`` who share a hobby with
+    ``user_id``, ordered like the other rankings. One aggregate query over the
+    through table, bounded by the number of candidates.
+    """
+    if not candidate_ids:
+        return []
+    through = CustomUser.hobbies.through
+    rows = (
+        through.objects.filter(
+            customuser_id__in=candidate_ids,
+            customuser__date_of_birth__range=(earliest_birthdate, latest_birthdate),
+            hobby_id__in=through.objects.filter(customuser_id=user_id).values('hobby_id'),
+        )
+        .values('customuser_id')
+        .annotate(common=Count('*'))
+        .order_by('-common', 'customuser_id')
+    )
+    return list(rows.values_list('customuser_id', 'common'))
+
+
+def annotate_relationship_status(
+    queryset: Union[QuerySet[CustomUser], RankedUsers], user: CustomUser
+) -> Union[QuerySet[CustomUser], RankedUsers]:
+    """
+    Annotate each user with ``is_friend`` and ``has_pending_request`` relative
+    to ``user``.
+
+    Both flags are EXISTS subqueries, so they are resolved in the same query
+    that fetches the page instead of costing two extra queries per row.
+    """
+    if isinstance(queryset, RankedUsers):
+        return queryset.using(annotate_relationship_status(queryset.queryset, user))
+    return queryset.annotate(
+        is_friend=Exists(
+            Friendship.objects.filter(
+                Q(user1=user, user2=OuterRef('pk')) | Q(user1=OuterRef('pk'), user2=user)
+            )
+        ),
+        has_pending_request=Exists(
+            FriendRequest.objects.filter(
+                Q(sender=user, receiver=OuterRef('pk')) | Q(sender=OuterRef('pk'), receiver=user),
+                status='pending'
+            )
+        ),
+    )
+
+
+def mutual_friend_counts(user: CustomUser, user_ids: List[int]) -> Dict[int, int]:
+    """
+    Return how many friends ``user`` shares with each of ``user_ids``.
+
+    Served from the in-memory friendship graph when it is loaded, and
+    otherwise from a single query over the Friendship rows linking
+    ``user_ids`` to the user's friends, counted in Python.
+    """
+    graph: Optional[friend_graph.FriendGraph] = friend_graph.get_loaded_graph()
+    if graph is not None and not graph.stale:
+        return graph.mutual_friends_with(user.id, user_ids)
+
+    counts: Dict[int, int] = {user_id: 0 for user_id in user_ids}
+    if not user_ids:
+        return counts
+    friend_ids: QuerySet = user.get_friends().values('id')
+    user1_shared = Q(user1_id__in=user_ids, user2_id__in=friend_ids)
+    user2_shared = Q(user2_id__in=user_ids, user1_id__in=friend_ids)
+    # A row between two listed users can be a mutual friendship for either side or both.
+    rows = Friendship.objects.filter(user1_shared | user2_shared).annotate(
+        user1_shared=ExpressionWrapper(user1_shared, output_field=BooleanField()),
+        user2_shared=ExpressionWrapper(user2_shared, output_field=BooleanField()),
+    ).values_list('user1_id', 'user2_id', 'user1_shared', 'user2_shared')
+    for user1_id, user2_id, is_user1_shared, is_user2_shared in rows:
+        if is_user1_shared:
+            counts[user1_id] += 1
+        if is_user2_shared:
+            counts[user2_id] += 1
+    return counts
+
+
+def common_hobby_counts(user: CustomUser, user_ids: List[int]) -> Dict[int, int]:
+    """
+    Return how many hobbies ``user`` shares with each of ``user_ids`` that
+    shares any, from one aggregate query over the through table. Unlike the
+    similar-user rankings, there is no age filter.
+    """
+    if not user_ids:
+        return {}
+    through = CustomUser.hobbies.through
+    rows = (
+        through.objects.filter(
+            customuser_id__in=user_ids,
+            hobby_id__in=through.objects.filter(customuser_id=user.id).values('hobby_id'),
+        )
+        .values('customuser_id')
+        .annotate(common=Count('*'))
+        .order_by()
+    )
+    return dict(rows.values_list('customuser_id', 'common'))
+
+
+def common_hobby_names(user: CustomUser, user_ids: List[int]) -> Dict[int, List[str]]:
+    """
+    Return the names of the hobbies ``user`` shares with each of
+    ``user_ids``, sorted by name, from one through-table query restricted to
+    those users and the user's hobbies.
+    """
+    names: Dict[int, List[str]] = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return names
+    through = CustomUser.hobbies.through
+    rows = through.objects.filter(
+        customuser_id__in=user_ids,
+        hobby_id__in=through.objects.filter(customuser_id=user.id).values('hobby_id'),
+    ).order_by('hobby__name').values_list('customuser_id', 'hobby__name')
+    for user_id, name in rows:
+        names[user_id].append(name)
+    return names
+
+
+def encode_cursor(score: float, user_id: int) -> str:
+    """
+    Encode the ``(score, user_id)`` key of the last row on a page as an opaque cursor.
+    """
+    return urlsafe_b64encode(f'{score!r}:{user_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Decode a cursor from ``encode_cursor``. Raises ValueError if it is malformed.
+    """
+    try:
+        score, user_id = urlsafe_b64decode(cursor.encode()).decode().split(':')
+        key: Tuple[float, int] = float(score), int(user_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Invalid cursor.') from e
+    # ``inf`` overflows the ORM's integer comparison, ``nan`` matches nothing.
+    if not math.isfinite(key[0]):
+        raise ValueError('Invalid cursor.')
+    return key
+
+
+def encode_sync_token(moment: datetime) -> str:
+    """
+    Encode the time a sync ran as an opaque token for the next ``/api/sync/``.
+    """
+    return urlsafe_b64encode(str(int(moment.timestamp() * 1_000_000)).encode()).decode()
+
+
+def decode_sync_token(token: str) -> datetime:
+    """
+    Decode a token from ``encode_sync_token``. Raises ValueError if it is malformed.
+    """
+    try:
+        micros: int = int(urlsafe_b64decode(token.encode()).decode())
+        return datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, UnicodeDecodeError, ValueError, OverflowError, OSError) as e:
+        raise ValueError('Invalid sync token.') from e
+
+
+def keyset_page(
+    users: Union[QuerySet[CustomUser], RankedUsers], cursor: str, page_size: int
+) -> Tuple[List[CustomUser], Optional[str]]:
+    """
+    Return the page of ``users`` ranked after ``cursor`` (the first page if it
+    is empty) and the cursor of the next page, or None on the last page.
+
+    Rows are keyed on (score, id) with the score descending and the id as a
+    deterministic tie-break, so a page costs the same however deep it is,
+    unlike OFFSET.
+    """
+    if isinstance(users, RankedUsers):
+        start: int = users.position_after(*decode_cursor(cursor)) if cursor else 0
+        end: int = start + page_size
+        next_cursor: Optional[str] = encode_cursor(*users.key_at(end - 1)) if end < len(users) else None
+        return users[start:end], next_cursor
+
+    if cursor:
+        score, user_id = decode_cursor(cursor)
+        users = users.filter(Q(common_hobbies__lt=score) | Q(common_hobbies=score, id__gt=user_id))
+    rows: List[CustomUser] = list(users[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    last: CustomUser = rows[page_size - 1]
+    return rows[:page_size], encode_cursor(last.common_hobbies, last.id)
 
 
 def flatten_errors(errors: Dict[str, List[str]]) -> str:
@@ -1,26 +1,34 @@
-from typing import Any, Dict, List, Optional
-from django.http import HttpResponse, HttpRequest, JsonResponse
+from typing import Any, Dict, List, Optional, Tuple
+from django.http import HttpResponse, HttpRequest, JsonResponse, StreamingHttpResponse
 from django.views.generic import CreateView, TemplateView, UpdateView
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 
 from api.forms import CustomUserChangeForm, CustomUserCreationForm
-from .models import CustomUser, Hobby, FriendRequest, Friendship
+from .models import CustomUser, Hobby, FriendRequest, Friendship, Tombstone
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.core.paginator import Paginator
-from .utils import flatten_errors, get_filtered_and_sorted_users
+from . import events, friend_graph, hobby_catalog, hobby_search
+from .signals import friendships_created
+from .utils import (
+    annotate_relationship_status, flatten_errors, get_similar_users, keyset_page,
+    mutual_friend_counts, decode_sync_token, encode_sync_token, add_hobbies, common_hobby_counts, common_hobby_names,
+)
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from datetime import date
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, timedelta
 import json
 
 
@@ -72,47 +80,159 @@ class EditProfileView(LoginRequiredMixin, UpdateView):
         return context
 
 
+SIMILAR_USERS_INCLUDES: Tuple[str, ...] = ("common_hobbies",)
+
+
+def _similar_users_data(
+    users: List[CustomUser], viewer: CustomUser, score: str, include: Tuple[str, ...] = ()
+) -> List[Dict[str, Any]]:
+    today: date = date.today()
+    mutual_friends: Dict[int, int] = mutual_friend_counts(viewer, [u.id for u in users])
+    hobby_names: Optional[Dict[int, List[str]]] = (
+        common_hobby_names(viewer, [u.id for u in users]) if "common_hobbies" in include else None
+    )
+    results: List[Dict[str, Any]] = []
+    for u in users:
+        age: Optional[int] = (today - u.date_of_birth).days // 365 if u.date_of_birth else None
+        user_data: Dict[str, Any] = {
+            "id": u.id,
+            "username": u.username,
+            "common_hobbies": u.common_hobbies,
+            "mutual_friends": mutual_friends[u.id],
+            "age": age,
+            "is_friend": u.is_friend,
+            "has_pending_request": u.has_pending_request,
+        }
+        if score != "overlap":
+            user_data["score"] = u.score
+        if hobby_names is not None:
+            user_data["common_hobby_names"] = hobby_names[u.id]
+        results.append(user_data)
+    return results
+
+
 @login_required
 @require_http_methods(["GET"])
 def fetch_similar_users_api(request: HttpRequest) -> JsonResponse:
     """
     Returns a paginated JSON list of users with similar hobbies.
+
+    Optional ``source`` ("orm", "index", "bitset", "precomputed" or the
+    approximate "minhash") picks the ranking backend; it defaults to the
+    hobby index when ``HOBBY_INDEX_ENABLED`` is set. Optional ``score``
+    ("overlap", "jaccard", "cosine" or "idf") picks the similarity measure;
+    "idf" weighs each shared hobby by its rarity. Anything but "overlap"
+    needs the bitset engine and adds a "score" to each result. Each result
+    also carries "mutual_friends", counted for the whole page at once.
+    ``include=common_hobbies`` adds "common_hobby_names" to each result,
+    read for the whole page in one query.
+
+    Pagination:
+      - ``page``: offset mode (default), with "count", "current_page" and
+        "total_pages" in the response.
+      - ``cursor``: keyset mode; pass an empty cursor for the first page and
+        the returned "next_cursor" afterwards (null on the last page).
+      - ``with_count``: "false" skips the COUNT query. Offset mode then
+        returns "has_next" instead of the totals. Defaults to "true" in
+        offset mode and "false" in cursor mode.
     """
     min_age: int = int(request.GET.get("min_age", 0))
     max_age: int = int(request.GET.get("max_age", 100))
     page: int = int(request.GET.get("page", 1))
+    source: Optional[str] = request.GET.get("source")
+    score: str = request.GET.get("score", "overlap")
+    cursor: Optional[str] = request.GET.get("cursor")
+    with_count: bool = request.GET.get("with_count", "true" if cursor is None else "false").lower() != "false"
+    include: Tuple[str, ...] = tuple(name for name in request.GET.get("include", "").split(",") if name)
+    page_size: int = 10
+
+    unknown: List[str] = [name for name in include if name not in SIMILAR_USERS_INCLUDES]
+    if unknown:
+        return JsonResponse({"error": f'Unknown include "{unknown[0]}".'}, status=400)
+    try:
+        similar_users = get_similar_users(request.user, min_age, max_age, source, score)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    users_queryset = annotate_relationship_status(similar_users, request.user)
+    response_data: Dict[str, Any]
 
-    users_queryset = get_filtered_and_sorted_users(request.user, min_age, max_age)
-    paginator = Paginator(users_queryset, 10)
-    paged_users = paginator.get_page(page)
+    if cursor is not None:
+        try:
+            paged_users, next_cursor = keyset_page(users_queryset, cursor, page_size)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        response_data = {
+            "results": _similar_users_data(paged_users, request.user, score, include),
+            "next_cursor": next_cursor,
+        }
+        if with_count:
+            response_data["count"] = users_queryset.count()
+    elif with_count:
+        paginator = Paginator(users_queryset, page_size)
+        paged_users = paginator.get_page(page)
+        response_data = {
+            "results": _similar_users_data(list(paged_users), request.user, score, include),
+            "count": paginator.count,
+            "current_page": paged_users.number,
+            "total_pages": paginator.num_pages,
+        }
+    else:
+        page = max(page, 1)
+        offset: int = (page - 1) * page_size
+        rows: List[CustomUser] = list(users_queryset[offset:offset + page_size + 1])
+        response_data = {
+            "results": _similar_users_data(rows[:page_size], request.user, score, include),
+            "current_page": page,
+            "has_next": len(rows) > page_size,
+        }
+    return JsonResponse(response_data)
 
-    users_list: List[Dict[str, Any]] = []
-    today: date = date.today()
-    for u in paged_users:
-        age: Optional[int] = (today - u.date_of_birth).days // 365 if u.date_of_birth else None
-        is_friend: bool = Friendship.objects.filter(
-            Q(user1=request.user, user2=u) | Q(user1=u, user2=request.user)
-        ).exists()
-        has_pending_request: bool = FriendRequest.objects.filter(
-            Q(sender=request.user, receiver=u) | Q(sender=u, receiver=request.user),
-            status='pending'
-        ).exists()
-        users_list.append({
-            "id": u.id,
-            "username": u.username,
-            "common_hobbies": u.common_hobbies,
-            "age": age,
-            "is_friend": is_friend,
-            "has_pending_request": has_pending_request,
-        })
 
-    response_data: Dict[str, Any] = {
-        "results": users_list,
-        "count": paginator.count,
-        "current_page": paged_users.number,
-        "total_pages": paginator.num_pages,
-    }
-    return JsonResponse(response_data)
+@login_required
+@require_http_methods(["GET"])
+def fetch_friend_suggestions_api(request: HttpRequest) -> JsonResponse:
+    """
+    "People you may know": users who are not yet friends, ranked by the
+    number of mutual friends in the in-memory friendship graph.
+
+    Query parameters:
+      - "limit": number of suggestions, 10 by default and at most 50.
+      - "hobby_weight": when above 0, the best ``FRIEND_SUGGESTION_POOL``
+        candidates by mutual friends are re-ranked by
+        ``mutual_friends + hobby_weight * common_hobbies``.
+    """
+    try:
+        limit: int = min(max(int(request.GET.get("limit", 10)), 1), 50)
+        hobby_weight: float = float(request.GET.get("hobby_weight", 0))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit or hobby_weight."}, status=400)
+
+    graph = friend_graph.get_graph()
+    common_hobbies: Dict[int, int] = {}
+    if hobby_weight > 0:
+        pool = graph.suggest(request.user.id, settings.FRIEND_SUGGESTION_POOL)
+        common_hobbies = common_hobby_counts(request.user, [user_id for user_id, _ in pool])
+        scored = [
+            (mutual + hobby_weight * common_hobbies.get(user_id, 0), user_id, mutual) for user_id, mutual in pool
+        ]
+        scored.sort(key=lambda row: (-row[0], row[1]))
+        suggestions = [(user_id, mutual) for _, user_id, mutual in scored[:limit]]
+    else:
+        suggestions = graph.suggest(request.user.id, limit)
+
+    users: Dict[int, CustomUser] = CustomUser.objects.only("id", "username").in_bulk(
+        [user_id for user_id, _ in suggestions]
+    )
+    results: List[Dict[str, Any]] = []
+    for user_id, mutual in suggestions:
+        if user_id not in users:
+            continue
+        suggestion: Dict[str, Any] = {"id": user_id, "username": users[user_id].username, "mutual_friends": mutual}
+        if hobby_weight > 0:
+            suggestion["common_hobbies"] = common_hobbies.get(user_id, 0)
+            suggestion["score"] = mutual + hobby_weight * suggestion["common_hobbies"]
+        results.append(suggestion)
+    return JsonResponse({"results": results})
 
 
 def logout_view(request: HttpRequest) -> JsonResponse:
@@ -126,17 +246,63 @@ def logout_view(request: HttpRequest) -> JsonResponse:
 def user_api(request: HttpRequest) -> HttpResponse:
     """
     API endpoint for the current user.
+
+    Optional query parameters keep the payload a constant size:
+      - "summary=1": replace the embedded friend list with "friend_count".
+      - "fields": comma-separated keys to return (e.g. "id,username,friend_count").
     """
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
 
     if request.method == 'GET':
-        user_data: Dict[str, Any] = request.user.as_dict()
+        summary: bool = request.GET.get('summary', '').lower() in ('1', 'true')
+        fields: Optional[set[str]] = (
+            {f.strip() for f in request.GET['fields'].split(',')} if request.GET.get('fields') else None
+        )
+        include_friends: bool = not summary and (fields is None or 'friends' in fields)
+        user_data: Dict[str, Any] = CustomUser.as_dicts([request.user], include_friends=include_friends)[0]
+        if summary or (fields is not None and 'friend_count' in fields):
+            user_data['friend_count'] = request.user.get_friend_count()
+        if fields is not None:
+            user_data = {key: value for key, value in user_data.items() if key in fields}
         return JsonResponse(user_data)
 
     return HttpResponse(status=405)
 
 
+@login_required
+@require_http_methods(["GET"])
+def friends_api(request: HttpRequest) -> JsonResponse:
+    """
+    Returns the current user's friends, ordered by username, one page at a time.
+
+    Query parameters:
+      - "q": optional username prefix (case-insensitive).
+      - "limit": page size, 20 by default and at most 100.
+      - "cursor": the "next_cursor" of the previous page (null on the last page).
+    """
+    prefix: str = request.GET.get('q', '').strip()
+    cursor: str = request.GET.get('cursor', '')
+    try:
+        limit: int = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        after: Optional[str] = urlsafe_b64decode(cursor.encode()).decode() if cursor else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit or cursor.'}, status=400)
+
+    friends = request.user.get_friends().order_by('username')
+    if prefix:
+        friends = friends.filter(username__istartswith=prefix)
+    if after is not None:
+        friends = friends.filter(username__gt=after)
+    rows: List[Dict[str, Any]] = list(friends.values('id', 'username', 'email')[:limit + 1])
+
+    next_cursor: Optional[str] = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = urlsafe_b64encode(rows[-1]['username'].encode()).decode()
+    return JsonResponse({'friends': rows, 'next_cursor': next_cursor})
+
+
 @login_required
 @require_http_methods(["PUT"])
 def update_profile_api(request: HttpRequest) -> JsonResponse:
@@ -237,8 +403,8 @@ def update_hobbies_api(request: HttpRequest) -> JsonResponse:
       - "hobby_id": (number) for removing.
     
     For 'add':  
-      If the hobby already exists in the Hobby table, it is retrieved and added to the user's hobbies.
-      If it does not exist, it is created, then added to the user's hobbies.
+      "hobby" may hold several comma-separated names. Hobbies that already exist in the Hobby table
+      are retrieved and the rest are created, then all are added to the user's hobbies at once.
     
     For 'remove':  
       Only the association between the user and the hobby is removed;
@@ -254,15 +420,9 @@ def update_hobbies_api(request: HttpRequest) -> JsonResponse:
 
     if action == "add":
         hobby_names: list[str] = [h.strip() for h in data.get('hobby', '').split(',') if h.strip()]
-        print(hobby_names)
-        for hobby_name in hobby_names:
-            if not hobby_name:
-                return JsonResponse({'error': 'Hobby name required'}, status=400)
-            # get_or_create returns a tuple of (object, created)
-            hobby, _ = Hobby.objects.get_or_create(name=hobby_name)
-            print("hobby:", hobby)
-            user.hobbies.add(hobby)
-            user.save()
+        if not hobby_names:
+            return JsonResponse({'error': 'Hobby name required'}, status=400)
+        add_hobbies(user, hobby_names)
         return JsonResponse({
             'message': f'Hobby "{", ".join(hobby_names)}" added',
             'hobbies': [h.as_dict() for h in user.hobbies.all()]
@@ -274,7 +434,6 @@ def update_hobbies_api(request: HttpRequest) -> JsonResponse:
         except Hobby.DoesNotExist:
             return JsonResponse({'error': 'Hobby not found'}, status=404)
         user.hobbies.remove(hobby)
-        user.save()
         return JsonResponse({
             'message': f'Hobby "{hobby.name}" removed',
             'hobbies': [h.as_dict() for h in user.hobbies.all()]
@@ -284,12 +443,167 @@ def update_hobbies_api(request: HttpRequest) -> JsonResponse:
 
 
 @require_http_methods(["GET"])
-def fetch_hobbies_api(request: HttpRequest) -> JsonResponse:
+def fetch_hobbies_api(request: HttpRequest) -> HttpResponse:
     """
     Returns a list of all hobbies available in the database.
+
+    The serialized catalog is cached per catalog version (bumped whenever a
+    hobby is saved or deleted), pre-compressed with gzip (and brotli when
+    installed), and tagged with an ETag. A matching ``If-None-Match`` gets a
+    304 from a single cache lookup, without touching the database.
+    """
+    version: int = hobby_catalog.get_version()
+    etag: str = hobby_catalog.etag(version)
+    headers: Dict[str, str] = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if_none_match: str = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag.removeprefix('W/') in {
+        tag.strip().removeprefix('W/') for tag in if_none_match.split(',')
+    }:
+        return HttpResponse(status=304, headers=headers)
+
+    payloads: Dict[str, bytes] = hobby_catalog.get_payloads(version)
+    coding: str = hobby_catalog.negotiate(request.headers.get('Accept-Encoding', ''), payloads)
+    if coding != 'identity':
+        headers['Content-Encoding'] = coding
+    return HttpResponse(payloads[coding], content_type='application/json', headers=headers)
+
+
+@login_required
+@require_http_methods(["GET"])
+def sync_api(request: HttpRequest) -> JsonResponse:
+    """
+    Return the hobbies, friend requests and friends that changed since the
+    client's last sync.
+
+    Query parameters:
+      - "since": the "token" from the previous response. Without it, or when
+        it is older than ``SYNC_TOMBSTONE_DAYS``, everything is returned and
+        "full" is true: all hobbies, pending requests sent or received, and
+        all friends.
+
+    Each of "hobbies", "friend_requests" and "friends" holds "updated" rows
+    and "deleted" IDs (user IDs for friends); apply deletions after updates.
+    Friend requests are sent in full whatever their status, so clients can
+    drop the ones that are no longer pending. Friends and received requests
+    are also resent when the other user edits their profile. Deltas overlap the previous
+    window by ``SYNC_OVERLAP_SECONDS`` so rows committed late are not missed,
+    and may therefore repeat rows.
+    """
+    now = timezone.now()
+    since: Optional[Any] = None
+    if request.GET.get('since'):
+        try:
+            since = decode_sync_token(request.GET['since'])
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+            since = None
+    full: bool = since is None
+    user_id: int = request.user.id
+
+    hobbies = Hobby.objects.order_by('id')
+    friend_requests = FriendRequest.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)).order_by('id')
+    friendships = Friendship.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id))
+    deleted: Dict[str, List[int]] = {
+        Tombstone.KIND_HOBBY: [], Tombstone.KIND_FRIEND_REQUEST: [], Tombstone.KIND_FRIEND: []
+    }
+    if full:
+        friend_requests = friend_requests.filter(status='pending')
+    else:
+        since -= timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+        hobbies = hobbies.filter(updated_at__gt=since)
+        # Rows are also resent when the other user's name or email changed.
+        friend_requests = friend_requests.filter(
+            Q(updated_at__gt=since) | Q(sender__updated_at__gt=since, receiver_id=user_id)
+        )
+        friendships = friendships.filter(
+            Q(updated_at__gt=since)
+            | Q(user1__updated_at__gt=since, user2_id=user_id)
+            | Q(user2__updated_at__gt=since, user1_id=user_id)
+        )
+        for kind, object_id in Tombstone.objects.filter(
+            Q(user_id=user_id) | Q(user_id__isnull=True, kind=Tombstone.KIND_HOBBY), deleted_at__gt=since
+        ).values_list('kind', 'object_id'):
+            deleted[kind].append(object_id)
+
+    friends: List[Dict[str, Any]] = []
+    for user1_id, user1_username, user1_email, user2_id, user2_username, user2_email in friendships.values_list(
+        'user1_id', 'user1__username', 'user1__email', 'user2_id', 'user2__username', 'user2__email'
+    ):
+        if user1_id == user_id:
+            friends.append({'id': user2_id, 'username': user2_username, 'email': user2_email})
+        else:
+            friends.append({'id': user1_id, 'username': user1_username, 'email': user1_email})
+
+    return JsonResponse({
+        'token': encode_sync_token(now),
+        'full': full,
+        'hobbies': {
+            'updated': list(hobbies.values('id', 'name', 'description')),
+            'deleted': deleted[Tombstone.KIND_HOBBY],
+        },
+        'friend_requests': {
+            'updated': [
+                {
+                    'id': pk, 'sender_id': sender_id, 'sender': sender, 'receiver_id': receiver_id,
+                    'status': status, 'timestamp': timestamp,
+                }
+                for pk, sender_id, sender, receiver_id, status, timestamp in friend_requests.values_list(
+                    'id', 'sender_id', 'sender__username', 'receiver_id', 'status', 'timestamp'
+                )
+            ],
+            'deleted': deleted[Tombstone.KIND_FRIEND_REQUEST],
+        },
+        'friends': {
+            'updated': sorted(friends, key=lambda friend: friend['id']),
+            'deleted': deleted[Tombstone.KIND_FRIEND],
+        },
+    })
+
+
+@require_http_methods(["GET"])
+def search_hobbies_api(request: HttpRequest) -> JsonResponse:
+    """
+    Hobby autocomplete: hobbies whose name starts with "q" (case- and
+    whitespace-insensitive), in name order.
+
+    Query parameters:
+      - "q": the prefix typed so far; empty lists hobbies from the start.
+      - "limit": number of results, 10 by default and at most 50.
+
+    Served from the in-memory prefix index when ``HOBBY_SEARCH_INDEX_ENABLED``
+    is set, otherwise from an indexed database query.
     """
-    hobbies = Hobby.objects.all()
-    return JsonResponse({'hobbies': [h.as_dict() for h in hobbies]})
+    prefix: str = request.GET.get('q', '')
+    try:
+        limit: int = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+    if settings.HOBBY_SEARCH_INDEX_ENABLED:
+        hobbies = hobby_search.get_search_index().search(prefix, limit)
+    else:
+        hobbies = hobby_search.search_database(prefix, limit)
+    return JsonResponse({'hobbies': hobbies})
+
+
+@require_http_methods(["GET"])
+def popular_hobbies_api(request: HttpRequest) -> JsonResponse:
+    """
+    The hobbies with the most users, most popular first.
+
+    Query parameters:
+      - "limit": number of results, 10 by default and at most 50.
+
+    Reads the denormalized ``Hobby.user_count`` through the
+    api_hobby_popular_idx index, so the cost does not grow with the number
+    of users.
+    """
+    try:
+        limit: int = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+    hobbies = Hobby.objects.order_by('-user_count', 'id').values('id', 'name', 'user_count')[:limit]
+    return JsonResponse({'hobbies': list(hobbies)})
 
 
 @login_required
@@ -315,30 +629,168 @@ def send_friend_request_api(request: HttpRequest) -> JsonResponse:
         if FriendRequest.objects.filter(sender=request.user, receiver=receiver, status='pending').exists():
             return JsonResponse({'error': 'Friend request already sent.'}, status=400)
 
-        FriendRequest.objects.create(sender=request.user, receiver=receiver)
+        try:
+            with transaction.atomic():
+                FriendRequest.objects.create(sender=request.user, receiver=receiver)
+        except IntegrityError:
+            # A concurrent call got there first (see api_friendrequest_unique_pending).
+            return JsonResponse({'error': 'Friend request already sent.'}, status=400)
         return JsonResponse({'message': 'Friend request sent successfully!'}, status=201)
     except CustomUser.DoesNotExist:
         return JsonResponse({'error': 'User not found.'}, status=404)
 
 
+@login_required
+@require_http_methods(["POST"])
+def send_friend_requests_api(request: HttpRequest) -> JsonResponse:
+    """
+    Send friend requests to several users at once.
+
+    Expects a JSON payload with:
+      - "receiver_ids": list of user IDs, at most 100.
+
+    Response:
+      - "results": one {"receiver_id", "status"} per distinct ID, in request
+        order, where status is "sent", "not_found", "self", "already_sent"
+        or "already_friends".
+    """
+    try:
+        data: Dict[str, Any] = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    receiver_ids = data.get('receiver_ids')
+    if (
+        not isinstance(receiver_ids, list)
+        or not receiver_ids
+        or not all(isinstance(i, int) and not isinstance(i, bool) for i in receiver_ids)
+    ):
+        return JsonResponse({'error': 'receiver_ids must be a non-empty list of user IDs.'}, status=400)
+    if len(receiver_ids) > 100:
+        return JsonResponse({'error': 'At most 100 receiver_ids per request.'}, status=400)
+
+    ids: List[int] = list(dict.fromkeys(receiver_ids))
+    user_id: int = request.user.id
+    with transaction.atomic():
+        existing = set(CustomUser.objects.filter(id__in=ids).values_list('id', flat=True))
+        already_sent = set(
+            FriendRequest.objects.filter(sender_id=user_id, receiver_id__in=ids, status='pending')
+            .values_list('receiver_id', flat=True)
+        )
+        already_friends: set = set()
+        for user1_id, user2_id in Friendship.objects.filter(
+            Q(user1_id=user_id, user2_id__in=ids) | Q(user2_id=user_id, user1_id__in=ids)
+        ).values_list('user1_id', 'user2_id'):
+            already_friends.add(user2_id if user1_id == user_id else user1_id)
+
+        statuses: Dict[int, str] = {}
+        for receiver_id in ids:
+            if receiver_id not in existing:
+                statuses[receiver_id] = 'not_found'
+            elif receiver_id == user_id:
+                statuses[receiver_id] = 'self'
+            elif receiver_id in already_friends:
+                statuses[receiver_id] = 'already_friends'
+            elif receiver_id in already_sent:
+                statuses[receiver_id] = 'already_sent'
+            else:
+                statuses[receiver_id] = 'sent'
+        sent: List[int] = [receiver_id for receiver_id, status in statuses.items() if status == 'sent']
+        FriendRequest.objects.bulk_create(
+            [FriendRequest(sender_id=user_id, receiver_id=receiver_id) for receiver_id in sent],
+            ignore_conflicts=True,
+        )
+        # ignore_conflicts leaves the primary keys unset, so read them back.
+        events.publish_on_commit(
+            events.friend_request_event('created', pk, user_id, request.user.username, receiver_id, timestamp)
+            for pk, receiver_id, timestamp in FriendRequest.objects.filter(
+                sender_id=user_id, receiver_id__in=sent, status='pending'
+            ).values_list('id', 'receiver_id', 'timestamp')
+        )
+
+    return JsonResponse({
+        'results': [{'receiver_id': receiver_id, 'status': status} for receiver_id, status in statuses.items()]
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+async def friend_request_events_api(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Server-Sent Events stream of the logged-in user's friend request events.
+
+    Each event is an ``event: friend_request`` message whose data is a JSON
+    object with "type" ("created", "accepted" or "rejected"), "id",
+    "sender_id", "sender", "receiver_id" and "timestamp". A comment line is
+    sent every ``FRIEND_EVENTS_HEARTBEAT`` seconds to keep idle connections
+    open. Needs an ASGI server (see project/asgi.py); each client holds one
+    coroutine and no database connection while it waits.
+    """
+    user: CustomUser = await request.auser()
+
+    async def stream():
+        broker = events.get_broker()
+        subscription = broker.subscribe(events.user_channel(user.id))
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event: Optional[Dict[str, Any]] = await subscription.get(settings.FRIEND_EVENTS_HEARTBEAT)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f'event: friend_request\ndata: {json.dumps(event)}\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies such as nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_http_methods(["GET"])
 def fetch_friend_requests_api(request: HttpRequest) -> JsonResponse:
     """
-    Fetch all pending friend requests for the logged-in user.
+    Fetch the logged-in user's pending friend requests, newest first, one
+    page at a time.
 
-    Response:
-      - List of pending friend requests.
+    Query parameters:
+      - "limit": page size, 20 by default and at most 100.
+      - "cursor": the "next_cursor" of the previous page (null on the last page).
+      - "count_only": "1" returns just {"count": <pending requests>}.
     """
-    friend_requests = FriendRequest.objects.filter(receiver=request.user, status='pending')
+    pending = FriendRequest.objects.filter(receiver=request.user, status='pending')
+    if request.GET.get('count_only') == '1':
+        return JsonResponse({'count': pending.count()})
+
+    cursor: str = request.GET.get('cursor', '')
+    try:
+        limit: int = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        if cursor:
+            timestamp, request_id = urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            after: Optional[Tuple[Any, int]] = (datetime.fromisoformat(timestamp), int(request_id))
+        else:
+            after = None
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({'error': 'Invalid limit or cursor.'}, status=400)
+
+    # Keyset pagination on (timestamp, id), the order of api_freq_receiver_status_idx.
+    if after is not None:
+        pending = pending.filter(Q(timestamp__lt=after[0]) | Q(timestamp=after[0], id__lt=after[1]))
+    rows = list(
+        pending.order_by('-timestamp', '-id').values_list('id', 'sender__username', 'timestamp')[:limit + 1]
+    )
+    next_cursor: Optional[str] = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_id, _, last_timestamp = rows[-1]
+        next_cursor = urlsafe_b64encode(f'{last_timestamp.isoformat()}|{last_id}'.encode()).decode()
     requests_data = [
-        {
-            'id': req.id,
-            'sender': req.sender.username,
-            'timestamp': req.timestamp,
-        } for req in friend_requests
+        {'id': request_id, 'sender': sender, 'timestamp': timestamp} for request_id, sender, timestamp in rows
     ]
-    return JsonResponse({'friend_requests': requests_data})
+    return JsonResponse({'friend_requests': requests_data, 'next_cursor': next_cursor})
 
 
 @login_required
@@ -352,23 +804,100 @@ def handle_friend_request_api(request, pk):
         if action not in ["accept", "reject"]:
             return JsonResponse({"error": "Invalid action."}, status=400)
 
-        friend_request = get_object_or_404(FriendRequest, id=pk, receiver=request.user)
-
-        if action == "accept":
-            with transaction.atomic():
+        with transaction.atomic():
+            # Lock the row so concurrent clicks on the same request serialize.
+            friend_request = get_object_or_404(
+                FriendRequest.objects.select_for_update(), id=pk, receiver=request.user
+            )
+            # Checked under the lock, so a repeated submit sees the first one's result.
+            if friend_request.status != "pending":
+                return JsonResponse(
+                    {"error": "Friend request already handled.", "status": "already_handled"}, status=400
+                )
+            if action == "accept":
                 friend_request.status = "accepted"
-                friend_request.save()
-                # Create bidirectional friendship
-                Friendship.objects.get_or_create(user1=request.user, user2=friend_request.sender)
-                Friendship.objects.get_or_create(user1=friend_request.sender, user2=request.user)
-            return JsonResponse({"message": "Friend request accepted successfully."}, status=200)
+                friend_request.save(update_fields=["status", "updated_at"])
+                Friendship.befriend(request.user, friend_request.sender)
+                return JsonResponse({"message": "Friend request accepted successfully."}, status=200)
 
-        elif action == "reject":
             friend_request.status = "rejected"
-            friend_request.save()
+            friend_request.save(update_fields=["status", "updated_at"])
             return JsonResponse({"message": "Friend request rejected."}, status=200)
 
     except FriendRequest.DoesNotExist:
         return JsonResponse({"error": "Friend request not found."}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def handle_friend_requests_api(request: HttpRequest) -> JsonResponse:
+    """
+    Accept or reject several friend requests at once.
+
+    Expects a JSON payload with:
+      - "request_ids": list of friend request IDs, at most 100.
+      - "action": "accept" or "reject".
+
+    The pending requests are locked with ``SELECT ... FOR UPDATE``, so
+    concurrent calls for the same requests cannot both handle them.
+
+    Response:
+      - "results": one {"request_id", "status"} per distinct ID, in request
+        order, where status is "accepted", "rejected", "not_found" or
+        "already_handled".
+    """
+    try:
+        data: Dict[str, Any] = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    action = data.get('action')
+    if action not in ('accept', 'reject'):
+        return JsonResponse({'error': 'Invalid action.'}, status=400)
+    request_ids = data.get('request_ids')
+    if (
+        not isinstance(request_ids, list)
+        or not request_ids
+        or not all(isinstance(i, int) and not isinstance(i, bool) for i in request_ids)
+    ):
+        return JsonResponse({'error': 'request_ids must be a non-empty list of friend request IDs.'}, status=400)
+    if len(request_ids) > 100:
+        return JsonResponse({'error': 'At most 100 request_ids per request.'}, status=400)
+
+    ids: List[int] = list(dict.fromkeys(request_ids))
+    new_status: str = 'accepted' if action == 'accept' else 'rejected'
+    with transaction.atomic():
+        current: Dict[int, Tuple[str, int, str, Any]] = {
+            pk: rest
+            for pk, *rest in FriendRequest.objects.select_for_update(of=('self',))
+            .filter(id__in=ids, receiver=request.user)
+            .values_list('id', 'status', 'sender_id', 'sender__username', 'timestamp')
+        }
+        pending: List[int] = [pk for pk, (status, *_) in current.items() if status == 'pending']
+        if pending:
+            FriendRequest.objects.filter(id__in=pending).update(status=new_status, updated_at=timezone.now())
+            # update() sends no post_save, so publish the status changes here.
+            events.publish_on_commit(
+                events.friend_request_event(new_status, pk, *current[pk][1:3], request.user.id, current[pk][3])
+                for pk in pending
+            )
+        if pending and action == 'accept':
+            pairs = sorted({Friendship.pair(request.user.id, current[pk][1]) for pk in pending})
+            Friendship.objects.bulk_create(
+                [Friendship(user1_id=user1_id, user2_id=user2_id) for user1_id, user2_id in pairs],
+                ignore_conflicts=True,
+            )
+            friendships_created(pairs)
+
+    results: List[Dict[str, Any]] = []
+    for pk in ids:
+        if pk not in current:
+            status = 'not_found'
+        elif current[pk][0] != 'pending':
+            status = 'already_handled'
+        else:
+            status = new_status
+        results.append({'request_id': pk, 'status': status})
+    return JsonResponse({'results': results})
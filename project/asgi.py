@@ -3,6 +3,12 @@ ASGI config for project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Long-lived responses such as the friend request event stream
+(/api/friend-request-events/) need an ASGI server, e.g.:
+
+    uvicorn project.asgi:application
+    gunicorn project.asgi:application -k uvicorn.workers.UvicornWorker
+
 For more information on this file, see
 https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
 """
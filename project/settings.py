@@ -129,6 +129,75 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'api.CustomUser'
 
+# Serve fetch-similar-users from the in-process inverted hobby index
+# (api/hobby_index.py) instead of the aggregate join in api/utils.py.
+HOBBY_INDEX_ENABLED = os.getenv('HOBBY_INDEX_ENABLED', 'False') == 'True'
+
+# Serve hobby autocomplete from the in-memory sorted prefix index
+# (api/hobby_search.py) instead of a LOWER(name) range query.
+HOBBY_SEARCH_INDEX_ENABLED = os.getenv('HOBBY_SEARCH_INDEX_ENABLED', 'False') == 'True'
+
+# Packed users x hobbies bit matrix (api/bitset_engine.py), needed for the
+# jaccard/cosine/idf scores. Only the TOP_K best matches per request are ranked.
+BITSET_ENGINE_ENABLED = os.getenv('BITSET_ENGINE_ENABLED', 'False') == 'True'
+BITSET_ENGINE_TOP_K = int(os.getenv('BITSET_ENGINE_TOP_K', '1000'))
+# Seconds before the engine re-reads the per-hobby IDF weights (score=idf)
+# from Hobby.user_count.
+BITSET_IDF_WEIGHTS_MAX_AGE = int(os.getenv('BITSET_IDF_WEIGHTS_MAX_AGE', '3600'))
+
+# Approximate candidate generation for fetch-similar-users (?source=minhash):
+# MinHash signatures over each user's hobbies, banded into LSH buckets
+# (api/minhash_index.py). PERMUTATIONS must be a multiple of BANDS; more bands
+# find weaker matches. MAX_CANDIDATES caps how many bucket collisions are
+# re-scored exactly, trading recall for latency (see
+# `manage.py benchmark_minhash`).
+MINHASH_INDEX_ENABLED = os.getenv('MINHASH_INDEX_ENABLED', 'False') == 'True'
+MINHASH_PERMUTATIONS = int(os.getenv('MINHASH_PERMUTATIONS', '64'))
+MINHASH_BANDS = int(os.getenv('MINHASH_BANDS', '32'))
+MINHASH_MAX_CANDIDATES = int(os.getenv('MINHASH_MAX_CANDIDATES', '1000'))
+
+# Matches kept per user by `manage.py build_matches` (?source=precomputed).
+MATCHES_TOP_K = int(os.getenv('MATCHES_TOP_K', '200'))
+
+# Candidates re-ranked by common hobbies in fetch-friend-suggestions.
+FRIEND_SUGGESTION_POOL = int(os.getenv('FRIEND_SUGGESTION_POOL', '500'))
+
+# Pub/sub behind the friend-request-events SSE stream (api/events.py). The
+# in-memory broker only reaches clients of the same process; use
+# api.events.PostgresBroker when running several ASGI workers on PostgreSQL.
+FRIEND_EVENTS_BACKEND = os.getenv('FRIEND_EVENTS_BACKEND', 'api.events.InMemoryBroker')
+FRIEND_EVENTS_HEARTBEAT = int(os.getenv('FRIEND_EVENTS_HEARTBEAT', '15'))
+
+# /api/sync/: how far each delta reaches back before the client's token, and
+# how long deletion tombstones are kept (`manage.py purge_tombstones`). Older
+# tokens get a full resync.
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', '5'))
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', '30'))
+
+# Cache each user's ranked match list per age range (api/match_cache.py).
+# Entries are invalidated whenever any user's hobbies or date of birth change.
+MATCH_CACHE_ENABLED = os.getenv('MATCH_CACHE_ENABLED', 'False') == 'True'
+MATCH_CACHE_ALIAS = 'matches'
+MATCH_CACHE_BACKEND = os.getenv('MATCH_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    # Also holds the hobby catalog and its version (api/hobby_catalog.py); with
+    # several worker processes use a shared backend so version bumps reach all.
+    'default': {
+        'BACKEND': os.getenv('DEFAULT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DEFAULT_CACHE_LOCATION', ''),
+    },
+    MATCH_CACHE_ALIAS: {
+        'BACKEND': MATCH_CACHE_BACKEND,
+        'LOCATION': os.getenv('MATCH_CACHE_LOCATION', 'matches'),
+        'TIMEOUT': int(os.getenv('MATCH_CACHE_TIMEOUT', '300')),
+    },
+}
+
+if MATCH_CACHE_BACKEND.endswith('LocMemCache'):
+    # Local memory evicts least recently used entries beyond this bound.
+    CACHES[MATCH_CACHE_ALIAS]['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('MATCH_CACHE_MAX_ENTRIES', '10000'))}
+
 # Password validation
 # https://docs.djangoproject.com/en/stable/ref/settings/#auth-password-validators
 